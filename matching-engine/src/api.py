@@ -1,27 +1,65 @@
 from fastapi import FastAPI, HTTPException, Request, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
 import time
-import uuid
 import logging
 import os
 import hashlib
-import subprocess
 from decimal import Decimal
+from functools import lru_cache
+
+import orjson
+from cachetools import TTLCache
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
 
 from .types import (
-    Order, OrderSide, OrderType, TimeInForce, OrderStatus, AssetPair,
-    Trade, OrderBookSnapshot, SettlementInstruction
+    Order, OrderSide, OrderType, TimeInForce, OrderStatus, AssetPair, intern_pair,
+    Trade, OrderBookSnapshot, OrderOut, SettlementInstruction
 )
 from .engine import engine, MatchingEngine
 from .stellar import stellar_service
+from .batcher import SignatureBatcher
+from .ids import fast_uuid4
 from .config import settings
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("api")
 
-app = FastAPI(title="Stellar Dark Pool Matching Engine")
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (Decimals are emitted as strings)."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tls_cert_path = os.getenv("TLS_CERT_PATH", "")
+    if tls_cert_path and os.path.exists(tls_cert_path):
+        try:
+            # Warm the SPKI cache; a rotated certificate is picked up via its mtime
+            _get_tls_spki_hash(tls_cert_path)
+        except Exception as e:
+            logger.warning(f"Could not precompute TLS SPKI hash: {e}")
+    yield
+    await signature_batcher.aclose()
+    # Give queued trades a chance to settle on-chain before the process exits
+    await engine.aclose()
+
+app = FastAPI(
+    title="Stellar Dark Pool Matching Engine",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,7 +70,7 @@ app.add_middleware(
 )
 
 # Request Models
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class SubmitOrderRequest(BaseModel):
     order_id: Optional[str] = None
@@ -40,23 +78,60 @@ class SubmitOrderRequest(BaseModel):
     asset_pair: AssetPair
     side: OrderSide
     order_type: OrderType
-    price: Optional[Decimal] = None
-    quantity: Decimal
+    # Amounts are settled in 7-decimal stroops; reject anything finer up front
+    price: Optional[Decimal] = Field(default=None, decimal_places=7)
+    quantity: Decimal = Field(decimal_places=7)
     time_in_force: TimeInForce
     timestamp: Optional[int] = None
     expiration: Optional[int] = None
     signature: str
 
-class SubmitOrderResponse(BaseModel):
-    order_id: str
-    status: str
-    trades: List[Trade]
+def _trade_payload(trade: Trade) -> dict:
+    # Trades come straight from the engine, so skip re-validating them on output
+    return {
+        "trade_id": trade.trade_id,
+        "buy_order_id": trade.buy_order_id,
+        "sell_order_id": trade.sell_order_id,
+        "price": str(trade.price),
+        "quantity": str(trade.quantity),
+        "buy_user": trade.buy_user,
+        "sell_user": trade.sell_user,
+        "asset_pair": {"base": trade.asset_pair.base, "quote": trade.asset_pair.quote},
+        "timestamp": trade.timestamp,
+    }
+
+@lru_cache(maxsize=1024)
+def _parse_pair(pair: str, allow_dash: bool = False) -> Optional[AssetPair]:
+    """Parse "BASE/QUOTE" (or "BASE-QUOTE" when allowed); None if malformed."""
+    if "/" in pair:
+        parts = pair.split("/")
+    elif allow_dash and "-" in pair:
+        parts = pair.split("-")
+    else:
+        return None
+    if len(parts) != 2:
+        return None
+    return intern_pair(parts[0], parts[1])
 
 # Dependency
 def get_engine():
     return engine
 
-@app.post("/api/v1/orders", response_model=SubmitOrderResponse)
+def _verify_signatures_batch(items):
+    # Look up the service at call time so it can be swapped out (e.g. in tests)
+    return stellar_service.verify_order_signatures_batch(items)
+
+def _verify_signature(order, signature, public_key):
+    return stellar_service.verify_order_signature(order, signature, public_key)
+
+signature_batcher = SignatureBatcher(
+    _verify_signatures_batch,
+    verify_one=_verify_signature,
+    window_ms=settings.signature_batch_window_ms,
+    max_batch=settings.signature_batch_max_size,
+)
+
+@app.post("/api/v1/orders", response_model=None)
 async def submit_order(req: SubmitOrderRequest, eng: MatchingEngine = Depends(get_engine)):
     # Validate
     if req.quantity <= 0:
@@ -64,13 +139,13 @@ async def submit_order(req: SubmitOrderRequest, eng: MatchingEngine = Depends(ge
     if req.price is not None and req.price <= 0:
         raise HTTPException(status_code=400, detail="Price must be positive")
 
-    order_id = req.order_id or str(uuid.uuid4())
+    order_id = req.order_id or fast_uuid4()
     timestamp = req.timestamp or int(time.time())
 
     order = Order(
         order_id=order_id,
         user_address=req.user_address,
-        asset_pair=req.asset_pair,
+        asset_pair=intern_pair(req.asset_pair.base, req.asset_pair.quote),
         side=req.side,
         order_type=req.order_type,
         price=req.price,
@@ -81,82 +156,88 @@ async def submit_order(req: SubmitOrderRequest, eng: MatchingEngine = Depends(ge
         signature=req.signature
     )
 
-    # Verify Signature
-    if not stellar_service.verify_order_signature(order, req.signature, req.user_address):
+    # Verify Signature (coalesced with concurrent submissions) before any
+    # balance lookup, so unauthenticated requests never reach the RPC
+    sig_ok = await signature_batcher.verify(order, req.signature, req.user_address)
+    if not sig_ok:
         raise HTTPException(status_code=401, detail="Invalid signature")
     
     order.signature = req.signature # Ensure set
 
     try:
         trades = await eng.submit_order(order)
-        return SubmitOrderResponse(
-            order_id=order_id,
-            status="submitted",
-            trades=trades
-        )
+        return ORJSONResponse({
+            "order_id": order_id,
+            "status": "submitted",
+            "trades": [_trade_payload(t) for t in trades],
+        })
     except ValueError as e:
         if "Insufficient" in str(e):
             raise HTTPException(status_code=402, detail=str(e))
+        if "Duplicate order id" in str(e):
+            raise HTTPException(status_code=409, detail=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/orders/{order_id}")
+@app.get("/api/v1/orders/{order_id}", response_model=OrderOut)
 async def get_order(order_id: str, asset_pair: str, eng: MatchingEngine = Depends(get_engine)):
     # Parse asset pair string "BASE/QUOTE"
-    parts = asset_pair.split("/")
-    if len(parts) != 2:
+    pair = _parse_pair(asset_pair)
+    if pair is None:
         raise HTTPException(status_code=400, detail="Invalid asset_pair format")
-    
-    pair = AssetPair(base=parts[0], quote=parts[1])
-    
+
     order = await eng.get_order(order_id, pair)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return OrderOut.model_validate(order, from_attributes=True)
 
 @app.delete("/api/v1/orders/{order_id}")
 async def cancel_order(order_id: str, user_address: str, asset_pair: str, eng: MatchingEngine = Depends(get_engine)):
-    parts = asset_pair.split("/")
-    if len(parts) != 2:
+    pair = _parse_pair(asset_pair)
+    if pair is None:
         raise HTTPException(status_code=400, detail="Invalid asset_pair format")
-    
-    pair = AssetPair(base=parts[0], quote=parts[1])
-    
+
     try:
         await eng.cancel_order(order_id, user_address, pair)
         return {"status": "cancelled"}
     except ValueError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
+# The order book hands out the same snapshot object until the top of book changes,
+# so its encoded body is reused for every poll in between
+_snapshot_body: Tuple[Any, bytes] = (None, b"")
+
+def _encode_snapshot(snapshot) -> bytes:
+    global _snapshot_body
+    cached, body = _snapshot_body
+    if snapshot is not cached:
+        body = orjson.dumps(snapshot, default=_json_default)
+        _snapshot_body = (snapshot, body)
+    return body
+
 @app.get("/api/v1/orderbook/{pair:path}", response_model=OrderBookSnapshot)
 async def get_order_book(pair: str, eng: MatchingEngine = Depends(get_engine)):
     # pair will catch "XLM/USDC" even if it contains slashes
-    if "/" in pair:
-        parts = pair.split("/")
-    elif "-" in pair:
-         parts = pair.split("-")
-    else:
-         raise HTTPException(status_code=400, detail="Invalid pair format")
-
-    if len(parts) != 2:
+    ap = _parse_pair(pair, allow_dash=True)
+    if ap is None:
         raise HTTPException(status_code=400, detail="Invalid pair format")
 
-    ap = AssetPair(base=parts[0], quote=parts[1])
-    return await eng.get_orderbook_snapshot(ap)
+    snapshot = await eng.get_orderbook_snapshot(ap)
+    return Response(_encode_snapshot(snapshot), media_type="application/json")
 
 @app.get("/api/v1/balances")
-async def get_balances(user_address: str, token: str):
-    # Retrieve balance
+async def get_balances(user_address: str, token: str, eng: MatchingEngine = Depends(get_engine)):
+    # Retrieve balance (served from the engine's balance cache when fresh)
     try:
         contract_id = stellar_service.get_contract_address(token)
-        balance = await stellar_service.get_vault_balance(user_address, contract_id)
-        
+        balance, cached = await eng.get_vault_balance(user_address, contract_id)
+
         return {
             "user_address": user_address,
             "asset": token,
             "contract_id": contract_id,
             "balance": str(balance),
             "balance_raw": balance,
-            "cached": False
+            "cached": cached
         }
     except Exception as e:
         logger.error(f"Balance check error: {e}")
@@ -169,12 +250,16 @@ async def health_check():
 def _get_tls_spki_hash(cert_path: str) -> str:
     if not cert_path or not os.path.exists(cert_path):
         raise ValueError("TLS certificate not found")
-    pubkey_pem = subprocess.check_output(
-        ["openssl", "x509", "-in", cert_path, "-pubkey", "-noout"]
-    )
-    spki_der = subprocess.check_output(
-        ["openssl", "pkey", "-pubin", "-outform", "DER"],
-        input=pubkey_pem
+    return _spki_hash_for(cert_path, os.stat(cert_path).st_mtime_ns)
+
+@lru_cache(maxsize=8)
+def _spki_hash_for(cert_path: str, mtime_ns: int) -> str:
+    # mtime_ns is part of the cache key so a rotated certificate is re-read
+    with open(cert_path, "rb") as f:
+        cert = x509.load_pem_x509_certificate(f.read())
+    spki_der = cert.public_key().public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo
     )
     return hashlib.sha256(spki_der).hexdigest()
 
@@ -193,14 +278,7 @@ def _jsonify_value(value):
         return [_jsonify_value(v) for v in value]
     return value
 
-def _quote_to_dict(quote_obj):
-    if isinstance(quote_obj, dict):
-        return quote_obj
-    if hasattr(quote_obj, "model_dump"):
-        return quote_obj.model_dump()
-    if hasattr(quote_obj, "to_dict"):
-        return quote_obj.to_dict()
-
+def _quote_attrs_to_dict(quote_obj):
     result = {}
     for attr in ("quote", "event_log", "vm_config", "report_data"):
         if hasattr(quote_obj, attr):
@@ -211,6 +289,40 @@ def _quote_to_dict(quote_obj):
         return quote_obj.__dict__
     return {"value": str(quote_obj)}
 
+# type -> extractor, resolved on the first quote of each type
+_QUOTE_EXTRACTORS: Dict[type, Callable[[Any], dict]] = {dict: lambda quote_obj: quote_obj}
+
+def _quote_to_dict(quote_obj):
+    quote_type = type(quote_obj)
+    extractor = _QUOTE_EXTRACTORS.get(quote_type)
+    if extractor is None:
+        if isinstance(quote_obj, dict):
+            extractor = _QUOTE_EXTRACTORS[dict]
+        elif hasattr(quote_type, "model_dump"):
+            extractor = quote_type.model_dump
+        elif hasattr(quote_type, "to_dict"):
+            extractor = quote_type.to_dict
+        else:
+            # Attributes may differ per instance, so keep probing each time
+            extractor = _quote_attrs_to_dict
+        _QUOTE_EXTRACTORS[quote_type] = extractor
+    return extractor(quote_obj)
+
+_dstack_client = None
+_dstack_client_lock = asyncio.Lock()
+
+# Quotes keyed by report_data; identical challenges within the same second share one quote
+_quote_cache: TTLCache = TTLCache(maxsize=256, ttl=1)
+
+async def _get_dstack_client():
+    global _dstack_client
+    if _dstack_client is None:
+        async with _dstack_client_lock:
+            if _dstack_client is None:
+                from dstack_sdk import DstackClient
+                _dstack_client = DstackClient()
+    return _dstack_client
+
 async def _build_attestation_response(challenge: Optional[str]) -> dict:
     if not os.path.exists("/var/run/dstack.sock"):
         raise HTTPException(
@@ -219,13 +331,12 @@ async def _build_attestation_response(challenge: Optional[str]) -> dict:
         )
 
     try:
-        from dstack_sdk import DstackClient
+        client = await _get_dstack_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"dstack-sdk unavailable: {e}")
 
     try:
-        tls_cert_path = os.getenv("TLS_CERT_PATH", "")
-        tls_spki_hash = _get_tls_spki_hash(tls_cert_path)
+        tls_spki_hash = _get_tls_spki_hash(os.getenv("TLS_CERT_PATH", ""))
         stellar_pubkey = _get_stellar_pubkey()
         timestamp = int(time.time())
 
@@ -242,12 +353,14 @@ async def _build_attestation_response(challenge: Optional[str]) -> dict:
         preimage = f"{stellar_pubkey}|{tls_spki_hash}|{timestamp}|{challenge_hex}"
         report_data = hashlib.sha256(preimage.encode()).digest()
 
-        client = DstackClient()
-        quote = client.get_quote(report_data)
-        quote_payload = _jsonify_value(_quote_to_dict(quote))
+        quote_payload = _quote_cache.get(report_data)
+        if quote_payload is None:
+            quote = await asyncio.to_thread(client.get_quote, report_data)
+            quote_payload = _jsonify_value(_quote_to_dict(quote))
 
-        # Ensure required fields are present for verifiers
-        quote_payload.setdefault("report_data", "0x" + report_data.hex())
+            # Ensure required fields are present for verifiers
+            quote_payload.setdefault("report_data", "0x" + report_data.hex())
+            _quote_cache[report_data] = quote_payload
 
         return {
             **quote_payload,
@@ -277,13 +390,12 @@ async def get_info():
             detail="TEE info not available (dstack socket not found)."
         )
     try:
-        from dstack_sdk import DstackClient
+        client = await _get_dstack_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"dstack-sdk unavailable: {e}")
 
     try:
-        client = DstackClient()
-        info = client.info()
+        info = await asyncio.to_thread(client.info)
         return _jsonify_value(_quote_to_dict(info))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -291,5 +403,5 @@ async def get_info():
 @app.post("/api/v1/admin/clear_cache")
 async def clear_balance_cache(eng: MatchingEngine = Depends(get_engine)):
     """Clear the vault balance cache to force fresh queries"""
-    eng.vault_balances.clear()
+    eng.clear_balance_cache()
     return {"status": "success", "message": "Balance cache cleared"}
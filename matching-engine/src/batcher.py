@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .types import Order
+
+logger = logging.getLogger(__name__)
+
+# (order, base64 signature, signer public key)
+SignatureItem = Tuple[Order, str, str]
+
+
+class SignatureBatcher:
+    """
+    Coalesces order signature checks into batches.
+
+    Callers await `verify()`; a background task drains the queue for up to
+    `window_ms` (or until `max_batch` items are pending) and verifies the whole
+    batch in a worker thread, so the event loop never runs Ed25519 itself.
+    If the batch call raises (or returns the wrong number of results), each
+    item is re-checked with `verify_one` so a single bad entry only fails its
+    own caller.
+    """
+
+    def __init__(
+        self,
+        verify_batch: Callable[[List[SignatureItem]], Sequence[bool]],
+        verify_one: Optional[Callable[[Order, str, str], bool]] = None,
+        window_ms: float = 1.0,
+        max_batch: int = 32,
+    ):
+        self._verify_batch = verify_batch
+        self._verify_one = verify_one
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def verify(self, order: Order, signature: str, public_key: str) -> bool:
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._queue.put_nowait((order, signature, public_key, future))
+        return await future
+
+    def _ensure_running(self):
+        # The worker is bound to the loop it was started on; restart it lazily
+        # if the loop changed (e.g. a new test event loop) or the task died.
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def aclose(self):
+        """Stop the worker task and fail any callers still waiting on it."""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            # A task from another (already closed) loop can't be awaited here
+            if self._loop is asyncio.get_running_loop():
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._queue is not None:
+            while not self._queue.empty():
+                *_, future = self._queue.get_nowait()
+                self._fail(future)
+        self._queue = None
+        self._loop = None
+
+    @staticmethod
+    def _fail(future):
+        if not future.done():
+            future.set_exception(RuntimeError("Signature batcher closed"))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.window
+
+                while len(batch) < self.max_batch:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._dispatch(batch)
+            except asyncio.CancelledError:
+                for *_, future in batch:
+                    self._fail(future)
+                raise
+
+    async def _dispatch(self, batch):
+        items = [(order, signature, public_key) for order, signature, public_key, _ in batch]
+        try:
+            results = await asyncio.to_thread(self._verify_batch, items)
+            # zip() below would silently leave the extra callers waiting forever
+            if len(results) != len(items):
+                raise ValueError(f"Batch verifier returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            logger.error(f"Batch signature verification failed: {e}")
+            if self._verify_one is None:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            results = await asyncio.to_thread(self._verify_each, items)
+
+        for (*_, future), ok in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(ok, Exception):
+                future.set_exception(ok)
+            else:
+                future.set_result(bool(ok))
+
+    def _verify_each(self, items: List[SignatureItem]) -> List[object]:
+        results = []
+        for item in items:
+            try:
+                results.append(self._verify_one(*item))
+            except Exception as e:
+                results.append(e)
+        return results
@@ -25,11 +25,41 @@ class Settings(BaseSettings):
         validation_alias="MATCHING_ENGINE_KEY_ALIAS"
     )
 
+    # Vault balance cache lifetime (seconds)
+    balance_cache_ttl: float = Field(
+        default=2.0,
+        validation_alias="BALANCE_CACHE_TTL"
+    )
+
+    # On-chain settlement retries (backoff doubles after each failed attempt)
+    settlement_max_attempts: int = Field(
+        default=3,
+        validation_alias="SETTLEMENT_MAX_ATTEMPTS"
+    )
+    settlement_retry_backoff: float = Field(
+        default=0.5,
+        validation_alias="SETTLEMENT_RETRY_BACKOFF"
+    )
+
+    # Signature Verification Batching
+    signature_batch_window_ms: float = Field(
+        default=1.0,
+        validation_alias="SIGNATURE_BATCH_WINDOW_MS"
+    )
+    signature_batch_max_size: int = Field(
+        default=32,
+        validation_alias="SIGNATURE_BATCH_MAX_SIZE"
+    )
+
     # Server Configuration
     rest_port: int = Field(
         default=8080,
         validation_alias="REST_PORT"
     )
+    access_log: bool = Field(
+        default=False,
+        validation_alias="ACCESS_LOG"
+    )
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
@@ -1,23 +1,48 @@
 import logging
 import time
 import asyncio
-from typing import Dict, List, Optional
-from decimal import Decimal
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
-from .types import Order, OrderSide, Trade, AssetPair, SettlementInstruction, OrderBookSnapshot
+from cachetools import LRUCache, TTLCache
+
+from .types import Order, OrderSide, Trade, AssetPair, SettlementInstruction, OrderBookSnapshot, STROOPS_PER_UNIT
 from .orderbook import OrderBook
 from .stellar import stellar_service
 from .config import settings
 
 logger = logging.getLogger(__name__)
 
+class _FetchAbandoned(Exception):
+    """Set on a shared balance fetch whose owning request was cancelled."""
+
 class MatchingEngine:
     def __init__(self):
         self.orderbook: Optional[OrderBook] = None
         self.base_asset: Optional[str] = None
         self.quote_asset: Optional[str] = None
-        # Vault Balances: user:contract_id -> amount (i128)
-        self.vault_balances: Dict[str, int] = {} 
+        # Vault Balances: (user, contract_id) -> amount (i128), expiring after balance_cache_ttl
+        self.vault_balances: TTLCache = TTLCache(maxsize=65536, ttl=settings.balance_cache_ttl)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # When each cached balance was fetched; hits past half the TTL refresh in the background
+        self._balance_fetched_at: TTLCache = TTLCache(maxsize=65536, ttl=settings.balance_cache_ttl)
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        # Deltas from matched trades not yet confirmed on-chain: (user, contract_id) -> i128
+        self._pending_deltas: Dict[Tuple[str, str], int] = {}
+        # Trades matched but not yet settled (or given up on), by trade id
+        self._unsettled: Dict[str, Tuple[Trade, int, int]] = {}
+        # Deltas of the trade whose transaction is being submitted right now
+        self._settling: Dict[Tuple[str, str], int] = {}
+        # Per key with a balance fetch reading the chain: [debits, settlements] confirmed meanwhile
+        self._fetch_windows: Dict[Tuple[str, str], List[int]] = {}
+        # Trades that still failed after settlement_max_attempts
+        self.failed_settlements: Deque[Trade] = deque(maxlen=1024)
+        # On-chain settlement runs in a background task, one transaction at a time
+        self._settle_q: Optional[asyncio.Queue] = None
+        self._settle_task: Optional[asyncio.Task] = None
+        self._settle_loop: Optional[asyncio.AbstractEventLoop] = None
+        # (base, quote) asset strings -> (base, quote) contract ids
+        self._pair_contracts: LRUCache = LRUCache(maxsize=1024)
         self._initialized = False
 
     async def initialize(self):
@@ -49,8 +74,7 @@ class MatchingEngine:
             await self.initialize()
 
         # 1. Validate assets - convert to contract addresses for comparison
-        order_base_contract = stellar_service.get_contract_address(order.asset_pair.base)
-        order_quote_contract = stellar_service.get_contract_address(order.asset_pair.quote)
+        order_base_contract, order_quote_contract = self._resolve_pair(order.asset_pair)
 
         if order_base_contract != self.base_asset or order_quote_contract != self.quote_asset:
              # Try reverse? Or just reject
@@ -63,39 +87,40 @@ class MatchingEngine:
         await self._check_balance(order)
 
         # 3. Match
-        trades = await self.orderbook.match_order(order)
-        
+        trades = self.orderbook.match_order_sync(order)
+
         # 4. Update internal balances
         for trade in trades:
-            await self._process_trade(trade)
+            self._process_trade(trade)
             
         return trades
 
+    def _resolve_pair(self, asset_pair: AssetPair) -> Tuple[str, str]:
+        key = (asset_pair.base, asset_pair.quote)
+        contracts = self._pair_contracts.get(key)
+        if contracts is None:
+            contracts = (
+                stellar_service.get_contract_address(asset_pair.base),
+                stellar_service.get_contract_address(asset_pair.quote),
+            )
+            self._pair_contracts[key] = contracts
+        return contracts
+
     async def _check_balance(self, order: Order):
-        # Determine required asset
+        # Determine required asset and amount (stroops)
         if order.side == OrderSide.Buy:
             asset_addr = self.quote_asset
-            if order.price:
-                req_amount = order.quantity * order.price
+            if order.price_scaled:
+                req_i128 = order.qty_scaled * order.price_scaled // STROOPS_PER_UNIT
             else:
-                req_amount = Decimal("0")
+                req_i128 = 0
         else:
             asset_addr = self.base_asset
-            req_amount = order.quantity
+            req_i128 = order.qty_scaled
 
         try:
-            cache_key = f"{order.user_address}:{asset_addr}"
-            
-            # Get balance (cache or fetch)
-            if cache_key in self.vault_balances:
-                balance = self.vault_balances[cache_key]
-            else:
-                balance = await stellar_service.get_vault_balance(order.user_address, asset_addr)
-                self.vault_balances[cache_key] = balance
-            
-            # req_amount to stroops (scaled 10^7)
-            req_i128 = int(req_amount * Decimal("10000000"))
-            
+            balance, _ = await self.get_vault_balance(order.user_address, asset_addr)
+
             if balance < req_i128:
                 raise ValueError(f"Insufficient vault balance: {balance} < {req_i128}")
                 
@@ -104,64 +129,254 @@ class MatchingEngine:
         except Exception as e:
             logger.warning(f"Balance check failed for {order.user_address}: {e}")
 
-    async def _process_trade(self, trade: Trade):
-        try:
-            base_amt = int(trade.quantity * Decimal("10000000"))
-            quote_amt = int(trade.quantity * trade.price * Decimal("10000000"))
+    async def get_vault_balance(self, user_address: str, asset_addr: str) -> Tuple[int, bool]:
+        """Return (balance, cached) for a user's vault balance, fetching it on a cache miss."""
+        key = (user_address, asset_addr)
+        balance = self.vault_balances.get(key)
+        if balance is not None:
+            self._maybe_refresh_balance(key)
+            return balance, True
 
-            # Buyer: +Base, -Quote
-            self._update_local_balance(trade.buy_user, self.base_asset, base_amt)
-            self._update_local_balance(trade.buy_user, self.quote_asset, -quote_amt)
+        # Concurrent misses for the same key share a single in-flight RPC
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight), False
+            except _FetchAbandoned:
+                # The fetching request was cancelled; look again and take over
+                # the fetch unless another waiter already has
+                return await self.get_vault_balance(user_address, asset_addr)
 
-            # Seller: -Base, +Quote
-            self._update_local_balance(trade.sell_user, self.base_asset, -base_amt)
-            self._update_local_balance(trade.sell_user, self.quote_asset, quote_amt)
+        return await self._fetch_balance(key), False
 
-            # Automatically settle the trade on-chain
-            await self._settle_trade(trade, base_amt, quote_amt)
+    def _maybe_refresh_balance(self, key: Tuple[str, str]):
+        # Refresh-ahead: serve the cached value now, re-fetch before it expires so
+        # active traders rarely wait on the RPC. Trade updates rewrite the balance
+        # (restarting its TTL) but not its fetch time, so a missing fetch time
+        # means the value outlived the TTL and is stale.
+        if key in self._inflight:
+            return
+        fetched_at = self._balance_fetched_at.get(key)
+        if fetched_at is not None and time.monotonic() - fetched_at < settings.balance_cache_ttl / 2:
+            return
+        task = asyncio.get_running_loop().create_task(self._refresh_balance(key))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
 
+    async def _refresh_balance(self, key: Tuple[str, str]):
+        try:
+            await self._fetch_balance(key)
         except Exception as e:
-            logger.error(f"Error processing trade: {e}")
-            raise
+            logger.debug(f"Background balance refresh failed for {key[0]}: {e}")
 
-    async def _settle_trade(self, trade: Trade, base_amt: int, quote_amt: int):
-        """Automatically settle a matched trade on-chain"""
+    async def _fetch_balance(self, key: Tuple[str, str]) -> int:
+        user_address, asset_addr = key
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        settling_at_start = key in self._settling
+        window = self._fetch_windows[key] = [0, 0]
         try:
-            from .types import SettlementInstruction
-
-            # Create settlement instruction
-            instruction = SettlementInstruction(
-                trade_id=trade.trade_id,
-                buy_user=trade.buy_user,
-                sell_user=trade.sell_user,
-                base_asset=trade.asset_pair.base,
-                quote_asset=trade.asset_pair.quote,
-                base_amount=base_amt,
-                quote_amount=quote_amt,
-                fee_base=0,
-                fee_quote=0,
-                timestamp=int(time.time()),
-                buy_order_signature="",  # Not needed for settlement authorization
-                sell_order_signature=""   # Not needed for settlement authorization
-            )
+            balance = await stellar_service.get_vault_balance(user_address, asset_addr)
+            # The chain doesn't reflect trades still waiting to settle
+            balance += self._pending_deltas.get(key, 0)
+            # A settlement touching this key that lands while we read may or may
+            # not be in the chain value: assume the worse case for each one (an
+            # in-flight debit already counted twice, a confirmed credit not yet
+            # seen) and don't treat the result as fresh
+            settling = self._settling.get(key, 0)
+            uncertain = settling_at_start or key in self._settling or window[1]
+            balance += min(0, -settling) + window[0]
+        except asyncio.CancelledError:
+            # Only the owner was cancelled; hand the fetch to the other waiters
+            future.set_exception(_FetchAbandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't log as unretrieved
+            raise
+        else:
+            self.vault_balances[key] = balance
+            if uncertain:
+                # Cached, but the next hit re-fetches it in the background
+                self._balance_fetched_at.pop(key, None)
+            else:
+                self._balance_fetched_at[key] = time.monotonic()
+            future.set_result(balance)
+            return balance
+        finally:
+            self._inflight.pop(key, None)
+            if self._fetch_windows.get(key) is window:
+                del self._fetch_windows[key]
+
+    def _trade_deltas(self, trade: Trade, base_amt: int, quote_amt: int):
+        return (
+            # Buyer: +Base, -Quote
+            (trade.buy_user, self.base_asset, base_amt),
+            (trade.buy_user, self.quote_asset, -quote_amt),
+            # Seller: -Base, +Quote
+            (trade.sell_user, self.base_asset, -base_amt),
+            (trade.sell_user, self.quote_asset, quote_amt),
+        )
 
-            logger.info(f"Settling trade {trade.trade_id} on-chain: {trade.quantity} @ {trade.price}")
+    def _process_trade(self, trade: Trade):
+        base_amt = trade.qty_scaled
+        quote_amt = trade.qty_scaled * trade.price_scaled // STROOPS_PER_UNIT
 
-            # Submit settlement transaction
-            tx_hash = await stellar_service.sign_and_submit_settlement(instruction)
+        # Balances are updated before returning so the next order's balance
+        # check sees this fill; only the on-chain settlement is deferred
+        for user, asset_addr, delta in self._trade_deltas(trade, base_amt, quote_amt):
+            self._update_local_balance(user, asset_addr, delta)
+            key = (user, asset_addr)
+            self._pending_deltas[key] = self._pending_deltas.get(key, 0) + delta
 
-            logger.info(f"✓ Trade {trade.trade_id} settled successfully. TX: {tx_hash}")
-            logger.info(f"  View on Stellar Expert: https://stellar.expert/explorer/testnet/tx/{tx_hash}")
+        self._unsettled[trade.trade_id] = (trade, base_amt, quote_amt)
+        self._enqueue_settlement(trade, base_amt, quote_amt)
 
-        except Exception as e:
-            logger.error(f"✗ Failed to settle trade {trade.trade_id}: {e}")
-            # Don't raise - we don't want to fail the order submission if settlement fails
-            # The trade is already matched locally, settlement can be retried
+    def _enqueue_settlement(self, trade: Trade, base_amt: int, quote_amt: int):
+        # The worker is bound to the loop it was started on; restart it lazily
+        # if the loop changed or the task died. The new queue starts with every
+        # trade still unsettled (this one included), so none are dropped with
+        # the old queue.
+        loop = asyncio.get_running_loop()
+        if self._settle_task is None or self._settle_task.done() or self._settle_loop is not loop:
+            self._settle_loop = loop
+            self._settle_q = asyncio.Queue()
+            for item in self._unsettled.values():
+                self._settle_q.put_nowait(item)
+            self._settle_task = loop.create_task(self._drain_settlements())
+            return
+        self._settle_q.put_nowait((trade, base_amt, quote_amt))
+
+    async def _drain_settlements(self):
+        while True:
+            batch = [await self._settle_q.get()]
+            while len(batch) < 64 and not self._settle_q.empty():
+                batch.append(self._settle_q.get_nowait())
+
+            for trade, base_amt, quote_amt in batch:
+                try:
+                    settled = await self._settle_with_retry(trade, base_amt, quote_amt)
+                    # Either way the chain is now the source of truth for this trade
+                    self._unsettled.pop(trade.trade_id, None)
+                    self._release_pending(trade, base_amt, quote_amt)
+                    if not settled:
+                        self._invalidate_balances(trade, base_amt, quote_amt)
+                finally:
+                    self._settle_q.task_done()
+
+    async def _settle_with_retry(self, trade: Trade, base_amt: int, quote_amt: int) -> bool:
+        """Settle a trade, retrying with backoff; returns False once it is given up on."""
+        deltas = self._trade_deltas(trade, base_amt, quote_amt)
+        max_attempts = max(1, settings.settlement_max_attempts)
+        for attempt in range(1, max_attempts + 1):
+            for user, asset_addr, delta in deltas:
+                key = (user, asset_addr)
+                self._settling[key] = self._settling.get(key, 0) + delta
+            try:
+                await self._settle_trade(trade, base_amt, quote_amt)
+                return True
+            except TimeoutError as e:
+                # Submitted but never confirmed: resubmitting could settle it twice
+                logger.error(f"✗ Settlement of trade {trade.trade_id} unconfirmed, not retrying: {e}")
+                break
+            except Exception as e:
+                logger.error(f"✗ Failed to settle trade {trade.trade_id} (attempt {attempt}/{max_attempts}): {e}")
+            finally:
+                for user, asset_addr, delta in deltas:
+                    key = (user, asset_addr)
+                    remaining = self._settling.get(key, 0) - delta
+                    if remaining:
+                        self._settling[key] = remaining
+                    else:
+                        self._settling.pop(key, None)
+            if attempt < max_attempts:
+                await asyncio.sleep(settings.settlement_retry_backoff * 2 ** (attempt - 1))
+
+        logger.error(f"✗ Giving up on settling trade {trade.trade_id}; balances fall back to the chain")
+        self.failed_settlements.append(trade)
+        return False
+
+    def _release_pending(self, trade: Trade, base_amt: int, quote_amt: int):
+        for user, asset_addr, delta in self._trade_deltas(trade, base_amt, quote_amt):
+            key = (user, asset_addr)
+            remaining = self._pending_deltas.get(key, 0) - delta
+            if remaining:
+                self._pending_deltas[key] = remaining
+            else:
+                self._pending_deltas.pop(key, None)
+            window = self._fetch_windows.get(key)
+            if window is not None:
+                window[0] += min(0, delta)
+                window[1] += 1
+
+    def _invalidate_balances(self, trade: Trade, base_amt: int, quote_amt: int):
+        # Cached balances still include the trade's deltas; re-read them from the chain
+        for user, asset_addr, _ in self._trade_deltas(trade, base_amt, quote_amt):
+            self.vault_balances.pop((user, asset_addr), None)
+            self._balance_fetched_at.pop((user, asset_addr), None)
+
+    async def _settle_trade(self, trade: Trade, base_amt: int, quote_amt: int) -> str:
+        """Settle a matched trade on-chain; returns the transaction hash"""
+        # Create settlement instruction
+        instruction = SettlementInstruction(
+            trade_id=trade.trade_id,
+            buy_user=trade.buy_user,
+            sell_user=trade.sell_user,
+            base_asset=trade.asset_pair.base,
+            quote_asset=trade.asset_pair.quote,
+            base_amount=base_amt,
+            quote_amount=quote_amt,
+            fee_base=0,
+            fee_quote=0,
+            timestamp=int(time.time()),
+            buy_order_signature="",  # Not needed for settlement authorization
+            sell_order_signature=""   # Not needed for settlement authorization
+        )
+
+        logger.info(f"Settling trade {trade.trade_id} on-chain: {trade.quantity} @ {trade.price}")
+
+        # Submit settlement transaction
+        tx_hash = await stellar_service.sign_and_submit_settlement(instruction)
+
+        logger.info(f"✓ Trade {trade.trade_id} settled successfully. TX: {tx_hash}")
+        logger.info(f"  View on Stellar Expert: https://stellar.expert/explorer/testnet/tx/{tx_hash}")
+        return tx_hash
+
+    def clear_balance_cache(self):
+        """Drop cached balances and rebuild the pending ledger from trades still awaiting settlement."""
+        self.vault_balances.clear()
+        self._balance_fetched_at.clear()
+        pending: Dict[Tuple[str, str], int] = {}
+        for trade, base_amt, quote_amt in self._unsettled.values():
+            for user, asset_addr, delta in self._trade_deltas(trade, base_amt, quote_amt):
+                key = (user, asset_addr)
+                pending[key] = pending.get(key, 0) + delta
+        self._pending_deltas = {key: delta for key, delta in pending.items() if delta}
+
+    async def aclose(self, timeout: float = 10.0):
+        """Wait up to `timeout` seconds for queued settlements, then stop the worker."""
+        task, self._settle_task = self._settle_task, None
+        if task is None:
+            return
+        if not task.done() and self._settle_loop is asyncio.get_running_loop():
+            try:
+                await asyncio.wait_for(self._settle_q.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Shutting down with {len(self._unsettled)} trades not settled on-chain")
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        else:
+            task.cancel()
 
     def _update_local_balance(self, user: str, asset_addr: str, delta: int):
-        key = f"{user}:{asset_addr}"
-        if key in self.vault_balances:
-            self.vault_balances[key] += delta
+        key = (user, asset_addr)
+        balance = self.vault_balances.get(key)
+        if balance is not None:
+            self.vault_balances[key] = balance + delta
 
     async def cancel_order(self, order_id: str, user_address: str, asset_pair: AssetPair):
         if not self._initialized: await self.initialize()
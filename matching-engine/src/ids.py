@@ -0,0 +1,24 @@
+import os
+import threading
+import uuid
+
+# Random bytes are drawn from the OS in bulk and handed out 16 at a time,
+# so generating an ID doesn't cost a getrandom() syscall every call.
+_POOL_SIZE = 4096
+_RNG_POOL = bytearray()
+_RNG_LOCK = threading.Lock()
+
+
+def _random16() -> bytes:
+    global _RNG_POOL
+    with _RNG_LOCK:
+        if len(_RNG_POOL) < 16:
+            _RNG_POOL = bytearray(os.urandom(_POOL_SIZE))
+        chunk = bytes(_RNG_POOL[-16:])
+        del _RNG_POOL[-16:]
+    return chunk
+
+
+def fast_uuid4() -> str:
+    """Random (version 4) UUID string, equivalent to str(uuid.uuid4())."""
+    return str(uuid.UUID(bytes=_random16(), version=4))
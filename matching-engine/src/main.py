@@ -12,6 +12,11 @@ def main():
         host="0.0.0.0",
         port=settings.rest_port,
         reload=False,
+        # Single worker: the order book and balance caches live in process memory
+        workers=1,
+        loop="uvloop",
+        http="httptools",
+        access_log=settings.access_log,
         ssl_certfile=tls_cert if use_tls else None,
         ssl_keyfile=tls_key if use_tls else None,
     )
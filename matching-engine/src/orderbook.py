@@ -1,106 +1,117 @@
 import time
-import uuid
 import logging
 import hashlib
-from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
-from sortedcontainers import SortedDict
+import secrets
+from itertools import islice
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from .types import (
     Order, OrderSide, OrderType, TimeInForce, OrderStatus, 
-    Trade, PriceLevel, OrderBookSnapshot, AssetPair
+    Trade, PriceLevel, OrderBookSnapshot, AssetPair, LevelChange, SnapshotDelta, from_stroops
 )
+from .pricetree import PriceLadder
 
 logger = logging.getLogger(__name__)
 
+# Price levels reported per side in a snapshot
+SNAPSHOT_DEPTH = 20
+
+def _price_levels(levels: List[Tuple[int, "LevelNode"]]) -> Tuple[PriceLevel, ...]:
+    return tuple(PriceLevel(price=from_stroops(price), quantity=from_stroops(level.agg_qty)) for price, level in levels)
+
+@dataclass(slots=True)
+class LevelNode:
+    """
+    Resting orders at one price, as an intrusive doubly-linked list threaded
+    through Order.prev_order/next_order. Head is the oldest order (time priority).
+    """
+    head: Optional[Order] = None
+    tail: Optional[Order] = None
+    # Unfilled quantity (stroops) across the level, kept current on add/fill/cancel
+    agg_qty: int = 0
+
+    def __bool__(self) -> bool:
+        return self.head is not None
+
+    def __iter__(self) -> Iterator[Order]:
+        node = self.head
+        while node is not None:
+            yield node
+            node = node.next_order
+
+    def append(self, order: Order):
+        order.prev_order = self.tail
+        order.next_order = None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next_order = order
+        self.tail = order
+        self.agg_qty += order.qty_scaled - order.filled_scaled
+
+    def remove(self, order: Order):
+        prev_order, next_order = order.prev_order, order.next_order
+        if prev_order is None:
+            self.head = next_order
+        else:
+            prev_order.next_order = next_order
+        if next_order is None:
+            self.tail = prev_order
+        else:
+            next_order.prev_order = prev_order
+        order.prev_order = order.next_order = None
+        self.agg_qty -= order.qty_scaled - order.filled_scaled
+
+    def popleft(self) -> Order:
+        order = self.head
+        self.remove(order)
+        return order
+
 class OrderBook:
     def __init__(self, asset_pair: AssetPair):
         self.asset_pair = asset_pair
+        # Price levels keyed by scaled int price (stroops), each a LevelNode of resting orders
         # Bids: Descending price (highest buy price first)
-        self.bids: SortedDict = SortedDict() 
-        self.asks: SortedDict = SortedDict() 
+        self.bids = PriceLadder(descending=True)
+        self.asks = PriceLadder()
         self.orders: Dict[str, Order] = {}
+        # Trade IDs: random per-book prefix + sequence (32 hex chars, as settlement expects)
+        self._trade_prefix = secrets.token_hex(8)
+        self._trade_seq = 0
+
+        # Last snapshot, shared by readers until a change lands inside the
+        # top-SNAPSHOT_DEPTH window it covers (None bound = window not full)
+        self._cached_snapshot: Optional[OrderBookSnapshot] = None
+        self._snapshot_dirty = True
+        self._bid_top20_floor: Optional[int] = None
+        self._ask_top20_ceiling: Optional[int] = None
+        # Levels touched since the last get_snapshot_delta(); None until a
+        # delta consumer first calls it, so an unwatched book tracks nothing
+        self._dirty_levels: Optional[Set[Tuple[OrderSide, int]]] = None
 
     async def match_order(self, order: Order) -> List[Trade]:
-        trades = []
-        remaining_quantity = order.quantity - order.filled_quantity
+        return self.match_order_sync(order)
+
+    def match_order_sync(self, order: Order) -> List[Trade]:
+        """Matching core: CPU-only and never suspends, so callers on the loop can skip the coroutine."""
+        # Reject before touching the book: order ids are client-supplied
+        if order.order_id in self.orders:
+            raise ValueError(f"Duplicate order id: {order.order_id}")
 
         if order.side == OrderSide.Buy:
             # Match against Asks (lowest sell price first)
-            while remaining_quantity > 0:
-                if not self.asks:
-                    break
-                
-                # Get best ask (lowest price)
-                best_price, orders_at_price = self.asks.peekitem(0)
-                
-                if order.price is not None and order.price < best_price:
-                    break # Limit price < best ask, can't match
-                
-                # Match against orders at this price level
-                while orders_at_price and remaining_quantity > 0:
-                    sell_order = orders_at_price[0]
-                    
-                    trade_quantity = min(remaining_quantity, sell_order.quantity - sell_order.filled_quantity)
-                    
-                    if trade_quantity > 0:
-                        trade = self._create_trade(order, sell_order, best_price, trade_quantity)
-                        trades.append(trade)
-                        
-                        remaining_quantity -= trade_quantity
-                        order.filled_quantity += trade_quantity
-                        sell_order.filled_quantity += trade_quantity
-                        
-                        self._update_order_status(sell_order)
-                        
-                        if sell_order.filled_quantity >= sell_order.quantity:
-                            orders_at_price.pop(0) # Remove filled order
-                        else:
-                            pass
-                    else:
-                        break
-                
-                if not orders_at_price:
-                    self.asks.popitem(0) # Remove empty price level
-                
-        else: # Sell Order
+            trades, remaining_quantity = self._match_side(order, self.asks)
+        else:
             # Match against Bids (highest buy price first)
-            while remaining_quantity > 0:
-                if not self.bids:
-                    break
-                
-                # Get best bid (highest price) -> last item in SortedDict
-                best_price, orders_at_price = self.bids.peekitem(-1)
-                
-                if order.price is not None and order.price > best_price:
-                    break # Limit price > best bid, can't match
-                
-                while orders_at_price and remaining_quantity > 0:
-                    buy_order = orders_at_price[0]
-                    
-                    trade_quantity = min(remaining_quantity, buy_order.quantity - buy_order.filled_quantity)
-                    
-                    if trade_quantity > 0:
-                        trade = self._create_trade(buy_order, order, best_price, trade_quantity)
-                        trades.append(trade)
-                        
-                        remaining_quantity -= trade_quantity
-                        order.filled_quantity += trade_quantity
-                        buy_order.filled_quantity += trade_quantity
-                        
-                        self._update_order_status(buy_order)
-                        
-                        if buy_order.filled_quantity >= buy_order.quantity:
-                            orders_at_price.pop(0)
-                        else:
-                            pass
-                    else:
-                        break
-                        
-                if not orders_at_price:
-                    self.bids.popitem(-1)
-
-        # Update incoming order status
+            trades, remaining_quantity = self._match_side(order, self.bids)
+
+        # Fills always consume the best levels
+        if trades:
+            self._snapshot_dirty = True
+
+        # Update incoming order status. Resting orders are mutated in place
+        # during fills, so this is the only write to `orders` per order.
         self._update_order_status(order)
         self.orders[order.order_id] = order
         
@@ -110,16 +121,67 @@ class OrderBook:
 
         return trades
 
-    def _create_trade(self, buy_order: Order, sell_order: Order, price: Decimal, quantity: Decimal) -> Trade:
-        trade_id = str(uuid.uuid4())
-        timestamp = int(time.time())
-        
+    def _match_side(self, order: Order, book: PriceLadder) -> Tuple[List[Trade], int]:
+        """Fill `order` against the opposite side `book`; returns (trades, unfilled qty)."""
+        trades = []
+        remaining_quantity = order.qty_scaled - order.filled_scaled
+        limit_price = order.price_scaled
+        is_buy = order.side == OrderSide.Buy
+        resting_side = OrderSide.Sell if is_buy else OrderSide.Buy
+        timestamp = time.time_ns() // 10**9
+
+        # Hold the current level across fills; the ladder is only touched
+        # again once a level is exhausted (pop + peek of the next in one call)
+        level = book.best() if book else None
+        while remaining_quantity > 0 and level is not None:
+            best_price, orders_at_price = level
+
+            if limit_price is not None and (limit_price < best_price if is_buy else limit_price > best_price):
+                break # Limit price doesn't cross the best opposing price
+
+            if self._dirty_levels is not None:
+                self._dirty_levels.add((resting_side, best_price))
+
+            # Match against orders at this price level
+            while orders_at_price and remaining_quantity > 0:
+                resting = orders_at_price.head
+
+                trade_quantity = min(remaining_quantity, resting.qty_scaled - resting.filled_scaled)
+                if trade_quantity <= 0:
+                    break
+
+                if is_buy:
+                    trades.append(self._create_trade(order, resting, best_price, trade_quantity, timestamp))
+                else:
+                    trades.append(self._create_trade(resting, order, best_price, trade_quantity, timestamp))
+
+                remaining_quantity -= trade_quantity
+                order.filled_scaled += trade_quantity
+                resting.filled_scaled += trade_quantity
+                orders_at_price.agg_qty -= trade_quantity
+
+                if resting.filled_scaled >= resting.qty_scaled:
+                    resting.status = OrderStatus.Filled
+                    orders_at_price.popleft() # Remove filled order
+                else:
+                    resting.status = OrderStatus.PartiallyFilled
+
+            if orders_at_price:
+                break # Incoming order is done; level keeps its remaining orders
+            level = book.pop_best_next() # Remove empty price level
+
+        return trades, remaining_quantity
+
+    def _create_trade(self, buy_order: Order, sell_order: Order, price: int, quantity: int, timestamp: int) -> Trade:
+        trade_id = f"{self._trade_prefix}{self._trade_seq:016x}"
+        self._trade_seq += 1
+
         return Trade(
             trade_id=trade_id,
             buy_order_id=buy_order.order_id,
             sell_order_id=sell_order.order_id,
-            price=price,
-            quantity=quantity,
+            price_scaled=price,
+            qty_scaled=quantity,
             buy_user=buy_order.user_address,
             sell_user=sell_order.user_address,
             asset_pair=self.asset_pair,
@@ -127,27 +189,39 @@ class OrderBook:
         )
 
     def _add_order_to_book(self, order: Order):
-        if order.price is None:
+        price = order.price_scaled
+        if price is None:
             return
 
-        price = order.price
         if order.side == OrderSide.Buy:
             if price not in self.bids:
-                self.bids[price] = []
+                self.bids[price] = LevelNode()
             self.bids[price].append(order)
         else:
             if price not in self.asks:
-                self.asks[price] = []
+                self.asks[price] = LevelNode()
             self.asks[price].append(order)
+        self._touch_level(order.side, price)
+
+    def _touch_level(self, side: OrderSide, price: int):
+        if self._dirty_levels is not None:
+            self._dirty_levels.add((side, price))
+        if self._snapshot_dirty:
+            return
+        if side == OrderSide.Buy:
+            bound = self._bid_top20_floor
+            if bound is None or price >= bound:
+                self._snapshot_dirty = True
+        else:
+            bound = self._ask_top20_ceiling
+            if bound is None or price <= bound:
+                self._snapshot_dirty = True
 
     def _update_order_status(self, order: Order):
-        if order.filled_quantity >= order.quantity:
+        if order.filled_scaled >= order.qty_scaled:
             order.status = OrderStatus.Filled
-        elif order.filled_quantity > 0:
+        elif order.filled_scaled > 0:
             order.status = OrderStatus.PartiallyFilled
-        
-        if order.order_id in self.orders:
-             self.orders[order.order_id] = order
 
     async def cancel_order(self, order_id: str, user_address: str):
         if order_id in self.orders:
@@ -158,35 +232,63 @@ class OrderBook:
             order.status = OrderStatus.Cancelled
             
             # Remove from book
-            if order.price:
+            price = order.price_scaled
+            if price:
                 target_book = self.bids if order.side == OrderSide.Buy else self.asks
-                if order.price in target_book:
-                    orders_at_price = target_book[order.price]
-                    target_book[order.price] = [o for o in orders_at_price if o.order_id != order_id]
-                    if not target_book[order.price]:
-                        del target_book[order.price]
+                orders_at_price = target_book.get(price)
+                # An order rests in at most one level, the one at its own price,
+                # so being linked (or the lone head) means it is in this one
+                is_resting = orders_at_price is not None and (
+                    order.prev_order is not None or orders_at_price.head is order
+                )
+                if is_resting:
+                    orders_at_price.remove(order)
+                    if not orders_at_price:
+                        del target_book[price]
+                    self._touch_level(order.side, price)
 
     async def get_snapshot(self) -> OrderBookSnapshot:
-        # Top 20 bids (descending)
-        bids_list = []
-        for price in reversed(self.bids):
-            orders = self.bids[price]
-            total_qty = sum(o.quantity - o.filled_quantity for o in orders)
-            bids_list.append(PriceLevel(price=price, quantity=total_qty))
-            if len(bids_list) >= 20: break
-            
-        # Top 20 asks (ascending)
-        asks_list = []
-        for price in self.asks:
-            orders = self.asks[price]
-            total_qty = sum(o.quantity - o.filled_quantity for o in orders)
-            asks_list.append(PriceLevel(price=price, quantity=total_qty))
-            if len(asks_list) >= 20: break
-            
-        return OrderBookSnapshot(
+        if not self._snapshot_dirty and self._cached_snapshot is not None:
+            return self._cached_snapshot
+
+        # Ladders iterate best-first, so the top levels are a prefix: no sort
+        top_bids = list(islice(self.bids.items(), SNAPSHOT_DEPTH))
+        top_asks = list(islice(self.asks.items(), SNAPSHOT_DEPTH))
+        # Deepest visible price per side; None while the side is not full
+        bid_floor = top_bids[-1][0] if len(top_bids) == SNAPSHOT_DEPTH else None
+        ask_ceiling = top_asks[-1][0] if len(top_asks) == SNAPSHOT_DEPTH else None
+
+        # Timestamp marks when this view of the book was taken
+        self._cached_snapshot = OrderBookSnapshot(
+            asset_pair=self.asset_pair,
+            bids=_price_levels(top_bids),
+            asks=_price_levels(top_asks),
+            timestamp=int(time.time())
+        )
+        self._bid_top20_floor = bid_floor
+        self._ask_top20_ceiling = ask_ceiling
+        self._snapshot_dirty = False
+        return self._cached_snapshot
+
+    async def get_snapshot_delta(self) -> SnapshotDelta:
+        """
+        Levels changed since the previous call. The first call starts tracking
+        and reports nothing; take the initial state from get_snapshot().
+        """
+        changes = []
+        for side, price in self._dirty_levels or ():
+            book = self.bids if side == OrderSide.Buy else self.asks
+            level = book.get(price)
+            changes.append(LevelChange(
+                side=side,
+                price=from_stroops(price),
+                quantity=from_stroops(level.agg_qty if level is not None else 0),
+            ))
+        self._dirty_levels = set()
+
+        return SnapshotDelta(
             asset_pair=self.asset_pair,
-            bids=bids_list,
-            asks=asks_list,
+            changes=tuple(changes),
             timestamp=int(time.time())
         )
 
@@ -0,0 +1,67 @@
+from typing import Any, Iterator, Optional, Tuple
+
+from sortedcontainers import SortedDict
+
+
+class PriceLadder:
+    """
+    One side of the book: price levels keyed by int price, ordered best-first.
+
+    Bids are best at the highest price (`descending=True`), asks at the lowest.
+    The ladder hides which end of the underlying sorted map is "best" so the
+    order book never indexes it directly. The best (price, level) pair is
+    cached and only re-read from the sorted map after the best level goes away.
+    """
+
+    __slots__ = ("_levels", "_best_index", "_best", "descending")
+
+    def __init__(self, descending: bool = False):
+        self._levels: SortedDict = SortedDict()
+        self.descending = descending
+        self._best_index = -1 if descending else 0
+        self._best: Optional[Tuple[int, Any]] = None  # None: unknown or empty
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    def __bool__(self) -> bool:
+        return bool(self._levels)
+
+    def __contains__(self, price: int) -> bool:
+        return price in self._levels
+
+    def __getitem__(self, price: int) -> Any:
+        return self._levels[price]
+
+    def __setitem__(self, price: int, level: Any):
+        self._levels[price] = level
+        best = self._best
+        if best is not None and (price >= best[0] if self.descending else price <= best[0]):
+            self._best = (price, level)
+
+    def __delitem__(self, price: int):
+        del self._levels[price]
+        if self._best is not None and self._best[0] == price:
+            self._best = None
+
+    def get(self, price: int, default: Optional[Any] = None) -> Any:
+        return self._levels.get(price, default)
+
+    def best(self) -> Tuple[int, Any]:
+        """(price, level) at the top of this side; IndexError if empty."""
+        best = self._best
+        if best is None:
+            best = self._best = self._levels.peekitem(self._best_index)
+        return best
+
+    def pop_best_next(self) -> Optional[Tuple[int, Any]]:
+        """Drop the best level and return the new best one, or None if emptied."""
+        levels = self._levels
+        levels.popitem(self._best_index)
+        self._best = levels.peekitem(self._best_index) if levels else None
+        return self._best
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        """(price, level) pairs from best to worst."""
+        items = self._levels.items()
+        return reversed(items) if self.descending else iter(items)
@@ -1,8 +1,12 @@
 import hashlib
 import base64
+import binascii
 import time
 import asyncio
 import logging
+import random
+import ssl
+from functools import lru_cache
 from decimal import Decimal
 from typing import Optional, Tuple, Any, Dict, List
 
@@ -17,21 +21,80 @@ from stellar_sdk import (
     Account
 )
 from stellar_sdk import scval
+from stellar_sdk.client.requests_client import RequestsClient
 from stellar_sdk.xdr import (
     LedgerKey,
     LedgerKeyAccount,
     LedgerEntryType,
     LedgerEntryData,
 )
+from nacl.bindings import crypto_sign_open
 
 from .types import Order, OrderSide, OrderType, TimeInForce, SettlementInstruction
 from .config import settings
 
 logger = logging.getLogger(__name__)
 
+SEP0053_PREFIX = "Stellar Signed Message:\n"
+_SEP0053_PREFIX_BYTES = SEP0053_PREFIX.encode("ascii")
+ED25519_SIGNATURE_LEN = 64
+# SHA-256 state with the prefix already absorbed; copy() it per message
+_SEP0053_HASHER = hashlib.sha256(_SEP0053_PREFIX_BYTES)
+
+# Map keys of the settle_trade argument struct, encoded once
+_SYM_BASE_AMOUNT = scval.to_symbol("base_amount")
+_SYM_BASE_ASSET = scval.to_symbol("base_asset")
+_SYM_BUY_USER = scval.to_symbol("buy_user")
+_SYM_FEE_BASE = scval.to_symbol("fee_base")
+_SYM_FEE_QUOTE = scval.to_symbol("fee_quote")
+_SYM_QUOTE_AMOUNT = scval.to_symbol("quote_amount")
+_SYM_QUOTE_ASSET = scval.to_symbol("quote_asset")
+_SYM_SELL_USER = scval.to_symbol("sell_user")
+_SYM_TIMESTAMP = scval.to_symbol("timestamp")
+_SYM_TRADE_ID = scval.to_symbol("trade_id")
+
+@lru_cache(maxsize=16384)
+def _decode_ed25519_public_key(address: str) -> bytes:
+    return strkey.StrKey.decode_ed25519_public_key(address)
+
+@lru_cache(maxsize=1024)
+def _asset_from_string(asset_str: str) -> Asset:
+    if asset_str == "XLM" or asset_str == "native":
+        return Asset.native()
+    
+    parts = asset_str.split(":")
+    if len(parts) == 2:
+        return Asset(parts[0], parts[1])
+    
+    raise ValueError(f"Invalid asset format: {asset_str}. Use 'XLM' or 'CODE:ISSUER'")
+
+# Keyed on the passphrase too: classic asset contract IDs are network-specific
+@lru_cache(maxsize=1024)
+def _contract_address(asset_str: str, network_passphrase: str) -> str:
+    if asset_str.startswith("C") and len(asset_str) == 56:
+        return asset_str
+    
+    if len(asset_str) == 64:
+        try:
+            raw_bytes = bytes.fromhex(asset_str)
+            return strkey.StrKey.encode_contract(raw_bytes)
+        except ValueError:
+            pass 
+
+    try:
+        asset = _asset_from_string(asset_str)
+        return asset.contract_id(network_passphrase)
+    except Exception as e:
+        raise ValueError(f"Could not derive contract ID for {asset_str}: {e}")
+
 class StellarService:
     def __init__(self):
-        self.soroban_server = SorobanServer(settings.soroban_rpc_url)
+        # One keep-alive session shared by every RPC call; blocking calls run in
+        # worker threads (asyncio.to_thread), so size the pool for concurrency
+        self.soroban_server = SorobanServer(
+            settings.soroban_rpc_url,
+            client=RequestsClient(pool_size=16),
+        )
         self.network_passphrase = settings.stellar_network_passphrase
         
         # Configure Network - Logging only as SDK v9+ uses passphrase in builders
@@ -42,6 +105,12 @@ class StellarService:
         else:
             logger.info(f"Using Custom Network with passphrase: {self.network_passphrase}")
 
+        # Order digests go through hashlib; only the OpenSSL build uses SHA-NI/ARMv8 SHA
+        if hashlib.sha256.__module__ != "_hashlib":
+            logger.warning("hashlib.sha256 is not OpenSSL-backed; order signature hashing will be slow")
+        else:
+            logger.debug(f"hashlib.sha256 backed by {ssl.OPENSSL_VERSION}")
+
     async def get_account_sequence(self, address: str) -> int:
         """
         Fetches the current sequence number for an account using Soroban RPC.
@@ -49,7 +118,7 @@ class StellarService:
         try:
             # Newer stellar-sdk versions have get_account helper
             if hasattr(self.soroban_server, "get_account"):
-                 account = self.soroban_server.get_account(address)
+                 account = await asyncio.to_thread(self.soroban_server.get_account, address)
                  return account.sequence
             
             # Fallback to getLedgerEntries
@@ -61,7 +130,7 @@ class StellarService:
                 account=LedgerKeyAccount(account_id=account_id)
             )
             key_b64 = base64.b64encode(ledger_key.to_xdr_bytes()).decode("utf-8")
-            response = self.soroban_server.get_ledger_entries([key_b64])
+            response = await asyncio.to_thread(self.soroban_server.get_ledger_entries, [key_b64])
             
             if not response.entries:
                 return 0
@@ -102,7 +171,7 @@ class StellarService:
                 parameters=[]
             )
             tx = tx_builder.build()
-            response = self.soroban_server.simulate_transaction(tx)
+            response = await asyncio.to_thread(self.soroban_server.simulate_transaction, tx)
             
             if response.results and len(response.results) > 0:
                 sc_val = xdr.SCVal.from_xdr(response.results[0].xdr)
@@ -130,72 +199,88 @@ class StellarService:
             raise e
 
     def asset_from_string(self, asset_str: str) -> Asset:
-        if asset_str == "XLM" or asset_str == "native":
-            return Asset.native()
-        
-        parts = asset_str.split(":")
-        if len(parts) == 2:
-            return Asset(parts[0], parts[1])
-        
-        raise ValueError(f"Invalid asset format: {asset_str}. Use 'XLM' or 'CODE:ISSUER'")
+        return _asset_from_string(asset_str)
 
     def get_contract_address(self, asset_str: str) -> str:
-        if asset_str.startswith("C") and len(asset_str) == 56:
-            return asset_str
-        
-        if len(asset_str) == 64:
-            try:
-                raw_bytes = bytes.fromhex(asset_str)
-                return strkey.StrKey.encode_contract(raw_bytes)
-            except ValueError:
-                pass 
-
-        try:
-            asset = self.asset_from_string(asset_str)
-            return asset.contract_id(self.network_passphrase)
-        except Exception as e:
-            raise ValueError(f"Could not derive contract ID for {asset_str}: {e}")
+        return _contract_address(asset_str, self.network_passphrase)
 
     # =========================================================================
     # SEP-0053 Signing & Verification
     # =========================================================================
 
     def create_order_message(self, order: Order) -> str:
-        parts = []
-        parts.append(f"order_id:{order.order_id}")
-        parts.append(f"user:{order.user_address}")
-        parts.append(f"pair:{order.asset_pair.base}/{order.asset_pair.quote}")
-        parts.append(f"side:{order.side.value}")
-        parts.append(f"type:{order.order_type.value}")
-        
-        if order.price is not None:
-            parts.append(f"price:{order.price}")
-            
-        parts.append(f"quantity:{order.quantity}")
-        parts.append(f"tif:{order.time_in_force.value}")
-        parts.append(f"timestamp:{order.timestamp}")
-        
-        if order.expiration is not None:
-            parts.append(f"expiration:{order.expiration}")
-            
-        return "|".join(parts)
+        # One f-string per order; optional fields are the only branches
+        pair = order.asset_pair
+        price = f"|price:{order.price}" if order.price is not None else ""
+        expiration = f"|expiration:{order.expiration}" if order.expiration is not None else ""
+        return (
+            f"order_id:{order.order_id}|user:{order.user_address}"
+            f"|pair:{pair.base}/{pair.quote}|side:{order.side.value}|type:{order.order_type.value}"
+            f"{price}|quantity:{order.quantity}|tif:{order.time_in_force.value}"
+            f"|timestamp:{order.timestamp}{expiration}"
+        )
 
-    def verify_order_signature(self, order: Order, signature: str, public_key: str) -> bool:
+    def _signed_digest(self, order: Order) -> bytes:
+        # SHA-256 of the SEP-0053 payload. Recomputed on every check: orders are
+        # mutable, so a memoized digest could outlive a change to a signed field
+        hasher = _SEP0053_HASHER.copy()
+        hasher.update(self.create_order_message(order).encode("utf-8"))
+        return hasher.digest()
+
+    def _verify_digest(self, digest: bytes, sig_bytes: bytes, address: str) -> bool:
         try:
-            message = self.create_order_message(order)
-            prefix = "Stellar Signed Message:\n"
-            full_message = (prefix + message).encode("utf-8")
-            message_hash = hashlib.sha256(full_message).digest()
-            
-            sig_bytes = base64.b64decode(signature)
-            
-            kp = Keypair.from_public_key(public_key)
-            kp.verify(message_hash, sig_bytes)
+            crypto_sign_open(sig_bytes + digest, _decode_ed25519_public_key(address))
             return True
         except Exception as e:
             logger.warning(f"Signature verification failed: {e}")
             return False
 
+    @staticmethod
+    def _decode_signature(signature: str) -> Optional[bytes]:
+        # Reject malformed input before any hashing or curve arithmetic
+        try:
+            sig_bytes = base64.b64decode(signature, validate=True)
+        except (binascii.Error, ValueError) as e:
+            logger.warning(f"Signature verification failed: {e}")
+            return None
+        if len(sig_bytes) != ED25519_SIGNATURE_LEN:
+            logger.warning(f"Signature verification failed: expected {ED25519_SIGNATURE_LEN} bytes, got {len(sig_bytes)}")
+            return None
+        return sig_bytes
+
+    def verify_order_signature(self, order: Order, signature: str, public_key: str) -> bool:
+        sig_bytes = self._decode_signature(signature)
+        if sig_bytes is None:
+            return False
+        return self._verify_digest(self._signed_digest(order), sig_bytes, public_key)
+
+    def verify_order_signature_prehashed(self, digest: bytes, signature: str, public_key: str) -> bool:
+        """
+        Verify a base64 order signature against an already computed SEP-0053 digest.
+        For callers that hashed the payload themselves; skips re-hashing the order.
+        """
+        sig_bytes = self._decode_signature(signature)
+        if sig_bytes is None:
+            return False
+        return self._verify_digest(digest, sig_bytes, public_key)
+
+    def verify_order_signatures_batch(self, items: List[Tuple[Order, str, str]]) -> List[bool]:
+        """
+        Verify a batch of (order, signature, public_key) items.
+        Returns one result per item, in the same order.
+        """
+        # Decode and length-check first so malformed items are never hashed,
+        # then hash the remaining payloads in one tight loop and run the Ed25519 checks
+        decoded = [self._decode_signature(signature) for _, signature, _ in items]
+        digests = [
+            self._signed_digest(order) if sig_bytes is not None else None
+            for sig_bytes, (order, _, _) in zip(decoded, items)
+        ]
+        return [
+            sig_bytes is not None and self._verify_digest(digest, sig_bytes, public_key)
+            for sig_bytes, digest, (_, _, public_key) in zip(decoded, digests, items)
+        ]
+
     # =========================================================================
     # Soroban Interactions (Vault Balance)
     # =========================================================================
@@ -232,7 +317,7 @@ class StellarService:
             tx = tx_builder.build()
             tx.sign(source_kp)
             
-            response = self.soroban_server.simulate_transaction(tx)
+            response = await asyncio.to_thread(self.soroban_server.simulate_transaction, tx)
 
             if hasattr(response, 'error') and response.error:
                 logger.error(f"Simulate transaction error: {response.error}")
@@ -313,7 +398,7 @@ class StellarService:
 
         # 1. Load account from Soroban RPC (includes sequence number)
         try:
-            source_account = self.soroban_server.load_account(me_kp.public_key)
+            source_account = await asyncio.to_thread(self.soroban_server.load_account, me_kp.public_key)
         except Exception as e:
              raise ValueError(f"Failed to load matching engine account {me_kp.public_key}: {str(e)}")
         
@@ -336,7 +421,7 @@ class StellarService:
         tx.sign(me_kp)
         
         # 3. Simulate
-        sim_response = self.soroban_server.simulate_transaction(tx)
+        sim_response = await asyncio.to_thread(self.soroban_server.simulate_transaction, tx)
         
         if sim_response.error:
              raise ValueError(f"Simulation failed: {sim_response.error}")
@@ -346,7 +431,7 @@ class StellarService:
         try:
             # We need to re-build or update the transaction with the simulation data.
             # Stellar SDK's SorobanServer usually has `prepare_transaction` helper
-            tx = self.soroban_server.prepare_transaction(tx, sim_response)
+            tx = await asyncio.to_thread(self.soroban_server.prepare_transaction, tx, sim_response)
         except AttributeError:
              # Fallback if specific method name differs in installed version
              # Assuming standard SDK v9 behavior where simulate returns data needed
@@ -357,33 +442,47 @@ class StellarService:
         tx.sign(me_kp)
         
         # 5. Submit
-        send_response = self.soroban_server.send_transaction(tx)
+        send_response = await asyncio.to_thread(self.soroban_server.send_transaction, tx)
         if send_response.status == "ERROR":
             raise ValueError(f"Submission failed: {send_response.error_result_xdr}")
             
         return await self._poll_transaction(send_response.hash)
 
-    async def _poll_transaction(self, tx_hash: str) -> str:
+    async def _poll_transaction(self, tx_hash: str, timeout: float = 120.0) -> str:
         from stellar_sdk.soroban_rpc import GetTransactionStatus
 
         logger.info(f"Polling transaction {tx_hash}")
-        # Testnet can be slow, so we increase the timeout to 120 seconds (60 attempts × 2 seconds)
-        for i in range(60):
-            res = self.soroban_server.get_transaction(tx_hash)
+        # Testnet can be slow, so allow up to `timeout` seconds. Polls start fast and
+        # back off (0.2s * 1.5^n, capped at 2s, plus jitter) so quick confirmations aren't
+        # stuck behind a fixed 2s sleep.
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        last_log = start
+        attempt = 0
+        await asyncio.sleep(0.15)
+        while True:
+            res = await asyncio.to_thread(self.soroban_server.get_transaction, tx_hash)
+            elapsed = loop.time() - start
 
             # Check against enum values, not string comparison
             if res.status == GetTransactionStatus.SUCCESS:
-                logger.info(f"Transaction {tx_hash} confirmed successfully after {i*2} seconds")
+                logger.info(f"Transaction {tx_hash} confirmed successfully after {elapsed:.1f} seconds")
                 return tx_hash
             if res.status == GetTransactionStatus.FAILED:
                 raise ValueError(f"Transaction failed on-chain: {res.result_xdr}")
 
-            if i % 10 == 0:  # Log every 20 seconds
+            if elapsed >= timeout:
+                break
+
+            if loop.time() - last_log >= 20:  # Log every 20 seconds
                 logger.info(f"Still waiting for transaction {tx_hash}... (status: {res.status})")
+                last_log = loop.time()
 
-            await asyncio.sleep(2)
+            delay = min(2.0, 0.2 * (1.5 ** attempt)) + random.uniform(0, 0.05)
+            attempt += 1
+            await asyncio.sleep(min(delay, max(0.0, timeout - elapsed)))
 
-        raise TimeoutError(f"Transaction polling timed out after 120 seconds. Last status: {res.status}. TX hash: {tx_hash}")
+        raise TimeoutError(f"Transaction polling timed out after {timeout:.0f} seconds. Last status: {res.status}. TX hash: {tx_hash}")
 
     def _build_settlement_args(self, instruction: SettlementInstruction) -> Any:
         # Convert asset strings to contract addresses if needed
@@ -401,16 +500,16 @@ class StellarService:
             trade_id_bytes = trade_id_bytes + b'\x00' * (32 - len(trade_id_bytes))
 
         data = {
-            scval.to_symbol("base_amount"): self._to_i128(instruction.base_amount),
-            scval.to_symbol("base_asset"): scval.to_address(base_asset_addr),
-            scval.to_symbol("buy_user"): scval.to_address(instruction.buy_user),
-            scval.to_symbol("fee_base"): self._to_i128(instruction.fee_base),
-            scval.to_symbol("fee_quote"): self._to_i128(instruction.fee_quote),
-            scval.to_symbol("quote_amount"): self._to_i128(instruction.quote_amount),
-            scval.to_symbol("quote_asset"): scval.to_address(quote_asset_addr),
-            scval.to_symbol("sell_user"): scval.to_address(instruction.sell_user),
-            scval.to_symbol("timestamp"): scval.to_uint64(instruction.timestamp),
-            scval.to_symbol("trade_id"): scval.to_bytes(trade_id_bytes),
+            _SYM_BASE_AMOUNT: self._to_i128(instruction.base_amount),
+            _SYM_BASE_ASSET: scval.to_address(base_asset_addr),
+            _SYM_BUY_USER: scval.to_address(instruction.buy_user),
+            _SYM_FEE_BASE: self._to_i128(instruction.fee_base),
+            _SYM_FEE_QUOTE: self._to_i128(instruction.fee_quote),
+            _SYM_QUOTE_AMOUNT: self._to_i128(instruction.quote_amount),
+            _SYM_QUOTE_ASSET: scval.to_address(quote_asset_addr),
+            _SYM_SELL_USER: scval.to_address(instruction.sell_user),
+            _SYM_TIMESTAMP: scval.to_uint64(instruction.timestamp),
+            _SYM_TRADE_ID: scval.to_bytes(trade_id_bytes),
         }
 
         return scval.to_map(data)
@@ -1,7 +1,22 @@
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, Tuple
 from decimal import Decimal
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel
+
+# Soroban token amounts are i128 stroops (1 unit = 10^7 stroops)
+STROOPS_PER_UNIT = 10_000_000
+
+def to_stroops(amount: Decimal) -> int:
+    return int(amount.scaleb(7))
+
+def from_stroops(amount: int) -> Decimal:
+    # Plain decimal text ("1.5", "100"), never exponent form
+    whole, frac = divmod(abs(amount), STROOPS_PER_UNIT)
+    text = f"{whole}.{frac:07d}".rstrip("0").rstrip(".")
+    return Decimal(f"-{text}" if amount < 0 else text)
 
 class OrderSide(str, Enum):
     Buy = "Buy"
@@ -24,38 +39,74 @@ class OrderStatus(str, Enum):
     Expired = "Expired"
     Rejected = "Rejected"
 
-class AssetPair(BaseModel):
-    model_config = ConfigDict(frozen=True)
+# Hot-path types are slotted dataclasses; Pydantic validation happens at the API boundary
 
+@dataclass(slots=True, frozen=True)
+class AssetPair:
     base: str
     quote: str
 
-class Order(BaseModel):
+@lru_cache(maxsize=4096)
+def intern_pair(base: str, quote: str) -> AssetPair:
+    """Shared AssetPair per (base, quote): equal pairs are the same object."""
+    return AssetPair(base=sys.intern(base), quote=sys.intern(quote))
+
+@dataclass(slots=True, kw_only=True)
+class Order:
     order_id: str
     user_address: str
     asset_pair: AssetPair
     side: OrderSide
     order_type: OrderType
+    # Decimal amounts are kept as submitted (they are part of the signed message);
+    # matching works on the scaled integer copies below
     price: Optional[Decimal] = None
     quantity: Decimal
-    filled_quantity: Decimal = Field(default_factory=lambda: Decimal("0"))
     time_in_force: TimeInForce
     timestamp: int
     expiration: Optional[int] = None
     signature: str = ""
     status: OrderStatus = OrderStatus.Pending
 
-class Trade(BaseModel):
+    # Amounts in stroops (STROOPS_PER_UNIT per unit)
+    price_scaled: Optional[int] = field(init=False, repr=False, compare=False)
+    qty_scaled: int = field(init=False, repr=False, compare=False)
+    filled_scaled: int = 0
+
+    # Neighbours in the resting price level (intrusive list owned by the order book)
+    prev_order: Optional["Order"] = field(default=None, init=False, repr=False, compare=False)
+    next_order: Optional["Order"] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # One shared str per account: trades and cancels then compare by identity first
+        self.user_address = sys.intern(self.user_address)
+        self.price_scaled = to_stroops(self.price) if self.price is not None else None
+        self.qty_scaled = to_stroops(self.quantity)
+
+    @property
+    def filled_quantity(self) -> Decimal:
+        return from_stroops(self.filled_scaled)
+
+@dataclass(slots=True, frozen=True, kw_only=True)
+class Trade:
     trade_id: str
     buy_order_id: str
     sell_order_id: str
-    price: Decimal
-    quantity: Decimal
+    price_scaled: int
+    qty_scaled: int
     buy_user: str
     sell_user: str
     asset_pair: AssetPair
     timestamp: int
 
+    @property
+    def price(self) -> Decimal:
+        return from_stroops(self.price_scaled)
+
+    @property
+    def quantity(self) -> Decimal:
+        return from_stroops(self.qty_scaled)
+
 class SettlementInstruction(BaseModel):
     trade_id: str
     buy_user: str
@@ -68,12 +119,43 @@ class SettlementInstruction(BaseModel):
     fee_quote: int = 0
     timestamp: int
 
-class PriceLevel(BaseModel):
+@dataclass(slots=True, frozen=True)
+class PriceLevel:
+    price: Decimal
+    quantity: Decimal
+
+@dataclass(slots=True, frozen=True, kw_only=True)
+class OrderBookSnapshot:
+    asset_pair: AssetPair
+    bids: Tuple[PriceLevel, ...]
+    asks: Tuple[PriceLevel, ...]
+    timestamp: int
+
+@dataclass(slots=True, frozen=True)
+class LevelChange:
+    """New aggregate quantity at one price; zero means the level is gone."""
+    side: OrderSide
     price: Decimal
     quantity: Decimal
 
-class OrderBookSnapshot(BaseModel):
+@dataclass(slots=True, frozen=True, kw_only=True)
+class SnapshotDelta:
+    asset_pair: AssetPair
+    changes: Tuple[LevelChange, ...]
+    timestamp: int
+
+class OrderOut(BaseModel):
+    """REST representation of an Order."""
+    order_id: str
+    user_address: str
     asset_pair: AssetPair
-    bids: List[PriceLevel]
-    asks: List[PriceLevel]
-    timestamp: int
\ No newline at end of file
+    side: OrderSide
+    order_type: OrderType
+    price: Optional[Decimal] = None
+    quantity: Decimal
+    filled_quantity: Decimal
+    time_in_force: TimeInForce
+    timestamp: int
+    expiration: Optional[int] = None
+    signature: str = ""
+    status: OrderStatus
\ No newline at end of file
@@ -1,8 +1,10 @@
 """
 Pytest configuration and fixtures for matching engine tests.
 """
+import zlib
 import pytest
 from decimal import Decimal
+from typing import NamedTuple
 from unittest.mock import AsyncMock, MagicMock
 from stellar_sdk import Keypair
 
@@ -11,7 +13,7 @@ from src.orderbook import OrderBook
 from src.engine import MatchingEngine
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def asset_pair():
     """Standard asset pair for testing."""
     return AssetPair(base="XLM", quote="USDC")
@@ -24,27 +26,81 @@ def orderbook(asset_pair):
 
 
 @pytest.fixture
-def matching_engine():
-    """Create a matching engine instance."""
-    return MatchingEngine()
+async def initialized_engine(mock_stellar_service):
+    """Matching engine initialized against the mocked stellar service."""
+    engine = MatchingEngine()
+    await engine.initialize()
+    return engine
+
+
+KEYPAIR_POOL_SIZE = 32
+
+
+@pytest.fixture(scope="session")
+def keypair_pool():
+    """Real signing keypairs, generated once per session for tests that sign."""
+    return tuple(Keypair.random() for _ in range(KEYPAIR_POOL_SIZE))
 
 
 @pytest.fixture
-def sample_keypair():
-    """Generate a test keypair."""
-    return Keypair.random()
+def fresh_keypair(keypair_pool, request):
+    """Pool keypair picked deterministically from the test id."""
+    return keypair_pool[zlib.crc32(request.node.nodeid.encode()) % KEYPAIR_POOL_SIZE]
 
 
 @pytest.fixture
+def other_keypair(keypair_pool, fresh_keypair):
+    """Pool keypair guaranteed to differ from `fresh_keypair`."""
+    return keypair_pool[(keypair_pool.index(fresh_keypair) + 1) % KEYPAIR_POOL_SIZE]
+
+
+class _StubKeypair(NamedTuple):
+    """Public key only: engine and orderbook tests never sign (verification is mocked)."""
+    public_key: str
+
+
+@pytest.fixture(scope="session")
 def user1_keypair():
     """User 1 keypair."""
-    return Keypair.random()
+    return _StubKeypair("GCATS5YOVB6ROX2WUNKGNQ2MP3GMXDMKSG2O4N5CLX3A6W4PZGZZI55U")
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def user2_keypair():
     """User 2 keypair."""
-    return Keypair.random()
+    return _StubKeypair("GDWUSKGGFDI4FRXK5EBTRECZSVQSSWJHHJOGH6JWG3AUMFFMQ435DIAG")
+
+
+@pytest.fixture(scope="session")
+def fake_public_key():
+    """Valid G... address for tests where signatures are mocked (zero-seed key)."""
+    return "GA5WUJ54Z23KILLCUOUNAKTPBVZWKMQVO4O6EQ5GHLAERIMLLHNCSKYH"
+
+
+# Common order amounts, parsed once
+PRICE_1_5 = Decimal("1.5")
+QTY_100 = Decimal("100")
+
+
+@pytest.fixture
+def make_order(asset_pair, user1_keypair):
+    """Factory for limit orders; keyword arguments override the defaults."""
+    def _make(**overrides):
+        fields = dict(
+            order_id="test-001",
+            user_address=user1_keypair.public_key,
+            asset_pair=asset_pair,
+            side=OrderSide.Buy,
+            order_type=OrderType.Limit,
+            price=PRICE_1_5,
+            quantity=QTY_100,
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890,
+            signature="sig",
+        )
+        fields.update(overrides)
+        return Order(**fields)
+    return _make
 
 
 @pytest.fixture
@@ -56,9 +112,8 @@ def buy_order(asset_pair, user1_keypair):
         asset_pair=asset_pair,
         side=OrderSide.Buy,
         order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        filled_quantity=Decimal("0"),
+        price=PRICE_1_5,
+        quantity=QTY_100,
         time_in_force=TimeInForce.GTC,
         timestamp=1234567890,
         signature="test-sig",
@@ -75,9 +130,8 @@ def sell_order(asset_pair, user2_keypair):
         asset_pair=asset_pair,
         side=OrderSide.Sell,
         order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        filled_quantity=Decimal("0"),
+        price=PRICE_1_5,
+        quantity=QTY_100,
         time_in_force=TimeInForce.GTC,
         timestamp=1234567891,
         signature="test-sig",
@@ -85,30 +139,66 @@ def sell_order(asset_pair, user2_keypair):
     )
 
 
-@pytest.fixture
-def mock_stellar_service(monkeypatch):
-    """Mock stellar service for testing without blockchain calls."""
-    from src import stellar
-    from src import engine as engine_module
+XLM_CONTRACT = "CDLZFC3SYJYDZT7K67VZ75HPJVIEUVNIXF47ZG2FB2RMQQVU2HHGCYSC"
+USDC_CONTRACT = "CBGTJ2FVGKZRQX4OVKWFLU3LBVXO5DSJFHZXFXMZFQZNVXPZMQWXLM7A"
+
+
+class _ContractMap(dict):
+    """Known test assets map to real-looking IDs; anything else gets a placeholder."""
+    def __missing__(self, asset_str):
+        return f"C{asset_str}CONTRACT"
+
 
-    mock = MagicMock()
-    mock.get_asset_a = AsyncMock(return_value="CDLZFC3SYJYDZT7K67VZ75HPJVIEUVNIXF47ZG2FB2RMQQVU2HHGCYSC")
-    mock.get_asset_b = AsyncMock(return_value="CBGTJ2FVGKZRQX4OVKWFLU3LBVXO5DSJFHZXFXMZFQZNVXPZMQWXLM7A")
+# Bound C-level lookup: cheaper per call than MagicMock side_effect dispatch
+_mock_get_contract_address = _ContractMap(XLM=XLM_CONTRACT, USDC=USDC_CONTRACT).__getitem__
 
-    # Mock get_contract_address to return contract IDs
-    def mock_get_contract_address(asset_str):
-        if asset_str == "XLM":
-            return "CDLZFC3SYJYDZT7K67VZ75HPJVIEUVNIXF47ZG2FB2RMQQVU2HHGCYSC"
-        elif asset_str == "USDC":
-            return "CBGTJ2FVGKZRQX4OVKWFLU3LBVXO5DSJFHZXFXMZFQZNVXPZMQWXLM7A"
-        else:
-            return f"C{asset_str}CONTRACT"
 
-    mock.get_contract_address = MagicMock(side_effect=mock_get_contract_address)
+def _configure_stellar_mock(mock):
+    """Defaults shared by every stellar service mock: valid signatures, large balances."""
+    mock.get_contract_address = _mock_get_contract_address
     mock.get_vault_balance = AsyncMock(return_value=1000000000000)  # Large balance
     mock.verify_order_signature = MagicMock(return_value=True)
+    return mock
+
+
+@pytest.fixture(scope="session")
+def configure_stellar_mock():
+    """Expose `_configure_stellar_mock` to test modules that patch their own target."""
+    return _configure_stellar_mock
+
+
+@pytest.fixture(scope="session")
+def _stellar_mock_template():
+    """Stellar service mock built once; returns (mock, configured attributes)."""
+    mock = _configure_stellar_mock(MagicMock())
+    mock.get_asset_a = AsyncMock(return_value=XLM_CONTRACT)
+    mock.get_asset_b = AsyncMock(return_value=USDC_CONTRACT)
     mock.sign_and_submit_settlement = AsyncMock(return_value="tx-hash-123")
 
+    configured = {
+        name: getattr(mock, name)
+        for name in (
+            "get_asset_a", "get_asset_b", "get_contract_address",
+            "get_vault_balance", "verify_order_signature", "sign_and_submit_settlement",
+        )
+    }
+    return mock, configured
+
+
+@pytest.fixture
+def mock_stellar_service(monkeypatch, _stellar_mock_template):
+    """Mock stellar service for testing without blockchain calls."""
+    from src import stellar
+    from src import engine as engine_module
+
+    mock, configured = _stellar_mock_template
+    mock.reset_mock()
+    # Tests may swap attributes (e.g. get_vault_balance); restore the defaults
+    for name, child in configured.items():
+        if isinstance(child, MagicMock | AsyncMock):
+            child.reset_mock()
+        setattr(mock, name, child)
+
     monkeypatch.setattr(stellar, "stellar_service", mock)
     monkeypatch.setattr(engine_module, "stellar_service", mock)
     return mock
@@ -1,67 +1,38 @@
 """
 Integration tests for API endpoints.
 """
+import orjson
 import pytest
-from fastapi.testclient import TestClient
+import httpx
+import pytest_asyncio
 from decimal import Decimal
 from unittest.mock import AsyncMock, MagicMock, patch
-from stellar_sdk import Keypair
 
 from src.api import app
-from src.types import AssetPair
+from src.types import AssetPair, intern_pair, Order, OrderBookSnapshot, OrderSide, OrderType, PriceLevel, TimeInForce, Trade
 
 
-@pytest.fixture
-def client():
-    """Create test client."""
-    return TestClient(app)
-
-
-@pytest.fixture
-def mock_engine():
-    """Mock matching engine."""
-    with patch('src.api.engine') as mock:
-        mock._initialized = True
-        mock.base_asset = "CXLMCONTRACT"
-        mock.quote_asset = "CUSDCCONTRACT"
-        mock.submit_order = AsyncMock(return_value=[])
-        mock.get_order = AsyncMock(return_value=None)
-        mock.cancel_order = AsyncMock()
-        mock.get_orderbook_snapshot = AsyncMock(return_value={
-            "asset_pair": {"base": "XLM", "quote": "USDC"},
-            "bids": [],
-            "asks": [],
-            "timestamp": 1234567890
-        })
-        yield mock
-
-
-@pytest.fixture
-def mock_stellar():
-    """Mock stellar service."""
-    with patch('src.api.stellar_service') as mock:
-        mock.verify_order_signature = MagicMock(return_value=True)
-        mock.get_contract_address = MagicMock(side_effect=lambda x: f"C{x}CONTRACT")
-        mock.get_vault_balance = AsyncMock(return_value=1000000000)
-        yield mock
+# One event loop for the module so the client (and the app's lifespan) is shared
+pytestmark = pytest.mark.asyncio(loop_scope="module")
 
 
-def test_health_check(client):
-    """Test health check endpoint."""
-    response = client.get("/health")
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def client():
+    """Async client over the ASGI app; lifespan runs once per module."""
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            yield c
 
-    assert response.status_code == 200
-    data = response.json()
-    assert data["status"] == "healthy"
-    assert "timestamp" in data
 
+JSON_HEADERS = {"content-type": "application/json"}
 
-def test_submit_order_valid(client, mock_engine, mock_stellar):
-    """Test submitting a valid order."""
-    keypair = Keypair.random()
 
-    order_data = {
-        "user_address": keypair.public_key,
+@pytest.fixture(scope="module")
+def valid_order(fake_public_key):
+    """Signed-looking limit buy accepted by the mocked stellar service."""
+    return {
+        "user_address": fake_public_key,
         "asset_pair": {"base": "XLM", "quote": "USDC"},
         "side": "Buy",
         "order_type": "Limit",
@@ -72,86 +43,146 @@ def test_submit_order_valid(client, mock_engine, mock_stellar):
         "signature": "test-signature"
     }
 
-    response = client.post("/api/v1/orders", json=order_data)
-
-    assert response.status_code == 200
-    data = response.json()
-    assert "order_id" in data
-    assert data["status"] == "submitted"
-    assert "trades" in data
-
 
-def test_submit_order_invalid_signature(client, mock_engine, mock_stellar):
-    """Test submitting order with invalid signature."""
-    mock_stellar.verify_order_signature = MagicMock(return_value=False)
+@pytest.fixture(scope="module")
+def valid_order_bytes(valid_order):
+    """`valid_order` serialized once for tests that post it unchanged."""
+    return orjson.dumps(valid_order)
 
-    keypair = Keypair.random()
 
-    order_data = {
-        "user_address": keypair.public_key,
+@pytest.fixture
+def mock_engine(monkeypatch):
+    """Mock matching engine."""
+    mock = MagicMock()
+    mock._initialized = True
+    mock.base_asset = "CXLMCONTRACT"
+    mock.quote_asset = "CUSDCCONTRACT"
+    mock.submit_order = AsyncMock(return_value=[])
+    mock.get_order = AsyncMock(return_value=None)
+    mock.cancel_order = AsyncMock()
+    mock.get_vault_balance = AsyncMock(return_value=(1000000000, False))
+    mock.get_orderbook_snapshot = AsyncMock(return_value={
         "asset_pair": {"base": "XLM", "quote": "USDC"},
-        "side": "Buy",
-        "order_type": "Limit",
-        "price": 1.5,
-        "quantity": 100,
-        "time_in_force": "GTC",
-        "timestamp": 1234567890,
-        "signature": "invalid-signature"
-    }
+        "bids": [],
+        "asks": [],
+        "timestamp": 1234567890
+    })
+    monkeypatch.setattr("src.api.engine", mock)
+    return mock
 
-    response = client.post("/api/v1/orders", json=order_data)
 
-    assert response.status_code == 401
-    assert "Invalid signature" in response.json()["detail"]
+@pytest.fixture
+def mock_stellar(monkeypatch, configure_stellar_mock):
+    """Mock stellar service."""
+    mock = configure_stellar_mock(MagicMock())
+    mock.verify_order_signatures_batch = MagicMock(
+        side_effect=lambda items: [mock.verify_order_signature(*item) for item in items]
+    )
+    monkeypatch.setattr("src.api.stellar_service", mock)
+    return mock
 
 
-def test_submit_order_invalid_quantity(client, mock_engine, mock_stellar):
-    """Test submitting order with invalid quantity."""
-    keypair = Keypair.random()
+async def test_health_check(client):
+    """Test health check endpoint."""
+    response = await client.get("/health")
 
-    order_data = {
-        "user_address": keypair.public_key,
-        "asset_pair": {"base": "XLM", "quote": "USDC"},
-        "side": "Buy",
-        "order_type": "Limit",
-        "price": 1.5,
-        "quantity": -100,
-        "time_in_force": "GTC",
-        "timestamp": 1234567890,
-        "signature": "test-signature"
-    }
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "healthy"
+    assert "timestamp" in data
 
-    response = client.post("/api/v1/orders", json=order_data)
 
-    assert response.status_code == 400
-    assert "Quantity must be positive" in response.json()["detail"]
+async def test_submit_order_valid(client, mock_engine, mock_stellar, valid_order_bytes):
+    """Test submitting a valid order."""
+    response = await client.post("/api/v1/orders", content=valid_order_bytes, headers=JSON_HEADERS)
 
+    assert response.status_code == 200
+    data = response.json()
+    assert "order_id" in data
+    assert data["status"] == "submitted"
+    assert "trades" in data
 
-def test_submit_order_invalid_price(client, mock_engine, mock_stellar):
-    """Test submitting order with invalid price."""
-    keypair = Keypair.random()
+    # Orders for the same pair share one interned AssetPair
+    submitted = mock_engine.submit_order.call_args.args[0]
+    assert submitted.asset_pair is intern_pair("XLM", "USDC")
+
+
+async def test_submit_order_returns_trades(client, mock_engine, mock_stellar, fake_public_key, valid_order_bytes):
+    """Test that fills are serialized in the order submission response."""
+    mock_engine.submit_order = AsyncMock(return_value=[
+        Trade(
+            trade_id="trade-1",
+            buy_order_id="buy-1",
+            sell_order_id="sell-1",
+            price_scaled=15000000,
+            qty_scaled=1000000000,
+            buy_user=fake_public_key,
+            sell_user="GSELLER",
+            asset_pair=AssetPair(base="XLM", quote="USDC"),
+            timestamp=1234567890
+        )
+    ])
+
+    response = await client.post("/api/v1/orders", content=valid_order_bytes, headers=JSON_HEADERS)
 
-    order_data = {
-        "user_address": keypair.public_key,
-        "asset_pair": {"base": "XLM", "quote": "USDC"},
-        "side": "Buy",
-        "order_type": "Limit",
-        "price": -1.5,
-        "quantity": 100,
-        "time_in_force": "GTC",
-        "timestamp": 1234567890,
-        "signature": "test-signature"
-    }
+    assert response.status_code == 200
+    trade = response.json()["trades"][0]
+    assert trade["trade_id"] == "trade-1"
+    assert trade["price"] == "1.5"
+    assert trade["quantity"] == "100"
+    assert trade["asset_pair"] == {"base": "XLM", "quote": "USDC"}
+
+
+@pytest.mark.parametrize("field,value,signature_ok,status_code,detail", [
+    ("signature", "invalid-signature", False, 401, "Invalid signature"),
+    ("quantity", -100, True, 400, "Quantity must be positive"),
+    ("price", -1.5, True, 400, "Price must be positive"),
+    # Amounts finer than 7 decimal places fail request validation
+    ("price", "1.00000001", True, 422, None),
+], ids=["bad-signature", "negative-quantity", "negative-price", "sub-stroop-price"])
+async def test_submit_order_rejected(client, mock_engine, mock_stellar, valid_order,
+                               field, value, signature_ok, status_code, detail):
+    """Test that invalid orders are rejected before reaching the engine."""
+    mock_stellar.verify_order_signature = MagicMock(return_value=signature_ok)
+
+    order_data = {**valid_order, field: value}
+
+    response = await client.post("/api/v1/orders", json=order_data)
+
+    assert response.status_code == status_code
+    if detail is not None:
+        assert detail in response.json()["detail"]
+    mock_engine.submit_order.assert_not_called()
+
+
+async def test_get_order(client, mock_engine, mock_stellar):
+    """Test getting an order returns its public fields only."""
+    order = Order(
+        order_id="order-1",
+        user_address="GUSER",
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("1.5"),
+        quantity=Decimal("100"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+    mock_engine.get_order = AsyncMock(return_value=order)
 
-    response = client.post("/api/v1/orders", json=order_data)
+    response = await client.get("/api/v1/orders/order-1?asset_pair=XLM/USDC")
 
-    assert response.status_code == 400
-    assert "Price must be positive" in response.json()["detail"]
+    assert response.status_code == 200
+    data = response.json()
+    assert data["order_id"] == "order-1"
+    assert data["price"] == "1.5"
+    assert data["filled_quantity"] == "0"
+    assert data["status"] == "Pending"
 
 
-def test_get_orderbook(client, mock_engine, mock_stellar):
+async def test_get_orderbook(client, mock_engine, mock_stellar):
     """Test getting orderbook."""
-    response = client.get("/api/v1/orderbook/XLM/USDC")
+    response = await client.get("/api/v1/orderbook/XLM/USDC")
 
     assert response.status_code == 200
     data = response.json()
@@ -160,47 +191,66 @@ def test_get_orderbook(client, mock_engine, mock_stellar):
     assert "timestamp" in data
 
 
-def test_get_orderbook_invalid_format(client, mock_engine, mock_stellar):
+async def test_get_orderbook_reuses_encoded_snapshot(client, mock_engine, mock_stellar):
+    """Test that an unchanged snapshot is served from the cached encoded body."""
+    snapshot = OrderBookSnapshot(
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        bids=(PriceLevel(price=Decimal("1.5"), quantity=Decimal("100")),),
+        asks=(),
+        timestamp=1234567890
+    )
+    mock_engine.get_orderbook_snapshot = AsyncMock(return_value=snapshot)
+
+    with patch('src.api.orjson.dumps', wraps=orjson.dumps) as dumps:
+        first = await client.get("/api/v1/orderbook/XLM/USDC")
+        second = await client.get("/api/v1/orderbook/XLM-USDC")
+
+    assert first.status_code == 200
+    assert first.json()["bids"] == [{"price": "1.5", "quantity": "100"}]
+    assert second.content == first.content
+    assert dumps.call_count == 1
+
+
+async def test_get_orderbook_invalid_format(client, mock_engine, mock_stellar):
     """Test getting orderbook with invalid format."""
-    response = client.get("/api/v1/orderbook/INVALID")
+    response = await client.get("/api/v1/orderbook/INVALID")
 
     assert response.status_code == 400
 
 
-def test_get_balances(client, mock_engine, mock_stellar):
+async def test_get_balances(client, mock_engine, mock_stellar, fake_public_key):
     """Test getting user balance."""
-    keypair = Keypair.random()
 
-    response = client.get(
-        f"/api/v1/balances?user_address={keypair.public_key}&token=XLM"
+    response = await client.get(
+        f"/api/v1/balances?user_address={fake_public_key}&token=XLM"
     )
 
     assert response.status_code == 200
     data = response.json()
     assert "balance" in data
     assert "user_address" in data
-    assert data["user_address"] == keypair.public_key
+    assert data["user_address"] == fake_public_key
 
 
-def test_attestation_no_tee(client):
+async def test_attestation_no_tee(client):
     """Test attestation endpoint when TEE is not available (normal local case)."""
-    response = client.get("/attestation")
+    response = await client.get("/attestation")
     
     assert response.status_code == 503
     assert "TEE attestation not available" in response.json()["detail"]
 
 
-def test_attestation_with_challenge_no_tee(client):
+async def test_attestation_with_challenge_no_tee(client):
     """Test attestation endpoint with challenge when TEE is not available."""
-    response = client.get("/attestation?challenge=deadbeef")
+    response = await client.get("/attestation?challenge=deadbeef")
     
     assert response.status_code == 503
     assert "TEE attestation not available" in response.json()["detail"]
 
 
-def test_info_no_tee(client):
+async def test_info_no_tee(client):
     """Test info endpoint when TEE is not available."""
-    response = client.get("/info")
+    response = await client.get("/info")
     
     assert response.status_code == 503
     assert "TEE info not available" in response.json()["detail"]
@@ -0,0 +1,40 @@
+"""
+Tests for the compose-hash helpers in scripts/.
+"""
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[2] / "scripts"
+
+# Floats the stdlib writes with a padded exponent (1e-07, 2.5e-05); any other
+# encoder that formats them differently changes the hash
+FLOAT_COMPOSE = {
+    "name": "app",
+    "ratio": 1e-07,
+    "scale": 2.5e-05,
+    "big": 1e+16,
+    "nested": {"z": 0.1, "a": [1e-07, None]},
+    "unset": None,
+}
+FLOAT_COMPOSE_HASH = "2426426866325008e465a62884b582edd9a3746ae60392379a39aa8a63f3a03d"
+
+
+def _load_script(name):
+    spec = importlib.util.spec_from_file_location(name, SCRIPTS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("script", ["compute_compose_hash", "verify_remote_attestation"])
+def test_compose_hash_pins_float_formatting(script):
+    """Test that floats round-trip through the canonical JSON exactly as json.dumps writes them."""
+    module = _load_script(script)
+
+    assert module.get_compose_hash(FLOAT_COMPOSE) == FLOAT_COMPOSE_HASH
+    # Same hash after a JSON round trip, as when read from app-compose.json
+    assert module.get_compose_hash(json.loads(json.dumps(FLOAT_COMPOSE))) == FLOAT_COMPOSE_HASH
+    assert b'"ratio":1e-07' in module.to_deterministic_json_bytes(FLOAT_COMPOSE)
@@ -1,15 +1,20 @@
 """
 Unit tests for MatchingEngine.
 """
+import asyncio
+import time
 import pytest
 from decimal import Decimal
 from unittest.mock import AsyncMock, MagicMock
 
-from src.types import Order, OrderSide, OrderType, TimeInForce, AssetPair
+from src.types import OrderSide, AssetPair, STROOPS_PER_UNIT
 from src.engine import MatchingEngine
+from src.config import settings
+
+# Exact bid prices; never derive prices from float arithmetic
+PRICES = (Decimal("1.0"), Decimal("1.1"), Decimal("1.2"))
 
 
-@pytest.mark.asyncio
 async def test_engine_initialization(mock_stellar_service):
     """Test matching engine initialization."""
     engine = MatchingEngine()
@@ -24,122 +29,57 @@ async def test_engine_initialization(mock_stellar_service):
     assert engine.orderbook is not None
 
 
-@pytest.mark.asyncio
-async def test_submit_order_with_balance_check(mock_stellar_service, user1_keypair):
+async def test_submit_order_with_balance_check(mock_stellar_service, initialized_engine, make_order):
     """Test submitting order with sufficient balance."""
-    engine = MatchingEngine()
-    await engine.initialize()
+    order = make_order(order_id="test-001")
 
-    order = Order(
-        order_id="test-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
-
-    trades = await engine.submit_order(order)
+    trades = await initialized_engine.submit_order(order)
 
     # No matches expected for first order
     assert len(trades) == 0
     mock_stellar_service.get_vault_balance.assert_called()
 
 
-@pytest.mark.asyncio
-async def test_submit_order_insufficient_balance(mock_stellar_service, user1_keypair):
+async def test_submit_order_insufficient_balance(mock_stellar_service, initialized_engine, make_order):
     """Test submitting order with insufficient balance."""
     # Mock insufficient balance
     mock_stellar_service.get_vault_balance = AsyncMock(return_value=0)
 
-    engine = MatchingEngine()
-    await engine.initialize()
 
-    order = Order(
-        order_id="test-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    order = make_order(order_id="test-001")
 
     with pytest.raises(ValueError, match="Insufficient vault balance"):
-        await engine.submit_order(order)
+        await initialized_engine.submit_order(order)
 
 
-@pytest.mark.asyncio
-async def test_submit_order_unsupported_asset_pair(mock_stellar_service, user1_keypair):
+async def test_submit_order_unsupported_asset_pair(initialized_engine, make_order):
     """Test submitting order with unsupported asset pair."""
-    engine = MatchingEngine()
-    await engine.initialize()
-
     # Order with different asset pair
-    order = Order(
-        order_id="test-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="BTC", quote="ETH"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    order = make_order(order_id="test-001", asset_pair=AssetPair(base="BTC", quote="ETH"))
 
     with pytest.raises(ValueError, match="Unsupported asset pair"):
-        await engine.submit_order(order)
+        await initialized_engine.submit_order(order)
 
 
-@pytest.mark.asyncio
-async def test_submit_matching_orders(mock_stellar_service, user1_keypair, user2_keypair):
+async def test_submit_matching_orders(initialized_engine, user2_keypair, make_order):
     """Test submitting two orders that match."""
-    engine = MatchingEngine()
-    await engine.initialize()
-
     # Buy order
-    buy_order = Order(
-        order_id="buy-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    buy_order = make_order(order_id="buy-001")
 
     # Sell order
-    sell_order = Order(
+    sell_order = make_order(
         order_id="sell-001",
         user_address=user2_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
         side=OrderSide.Sell,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567891,
-        signature="sig"
+        timestamp=1234567891
     )
 
     # Submit buy order
-    trades1 = await engine.submit_order(buy_order)
+    trades1 = await initialized_engine.submit_order(buy_order)
     assert len(trades1) == 0
 
     # Submit matching sell order
-    trades2 = await engine.submit_order(sell_order)
+    trades2 = await initialized_engine.submit_order(sell_order)
     assert len(trades2) == 1
 
     trade = trades2[0]
@@ -149,174 +89,354 @@ async def test_submit_matching_orders(mock_stellar_service, user1_keypair, user2
     assert trade.sell_user == sell_order.user_address
 
 
-@pytest.mark.asyncio
-async def test_balance_update_after_trade(mock_stellar_service, user1_keypair, user2_keypair):
-    """Test that internal balances are updated after trade."""
-    engine = MatchingEngine()
-    await engine.initialize()
+async def test_duplicate_order_id_rejected_before_matching(initialized_engine, user2_keypair, make_order):
+    """Test that reusing an order id is rejected without filling resting orders."""
+    resting = make_order(
+        order_id="sell-001",
+        user_address=user2_keypair.public_key,
+        side=OrderSide.Sell,
+        quantity=Decimal("200")
+    )
+    await initialized_engine.submit_order(resting)
+    assert len(await initialized_engine.submit_order(make_order(order_id="buy-001"))) == 1
+
+    with pytest.raises(ValueError, match="Duplicate order id"):
+        await initialized_engine.submit_order(make_order(order_id="buy-001"))
+
+    # The resting order was not touched by the rejected submission
+    assert resting.filled_scaled == 100 * STROOPS_PER_UNIT
+    assert initialized_engine.orderbook.asks[resting.price_scaled].agg_qty == 100 * STROOPS_PER_UNIT
 
+
+async def test_balance_update_after_trade(initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that internal balances are updated after trade."""
     # Cache initial balances
-    base_contract = engine.base_asset
-    quote_contract = engine.quote_asset
+    base_contract = initialized_engine.base_asset
+    quote_contract = initialized_engine.quote_asset
 
-    buyer_quote_key = f"{user1_keypair.public_key}:{quote_contract}"
-    seller_base_key = f"{user2_keypair.public_key}:{base_contract}"
+    buyer_quote_key = (user1_keypair.public_key, quote_contract)
+    seller_base_key = (user2_keypair.public_key, base_contract)
 
-    # Set initial cached balances
-    engine.vault_balances[buyer_quote_key] = 2000000000  # 200 XLM
-    engine.vault_balances[seller_base_key] = 2000000000  # 200 XLM
+    # Set initial cached balances, as if just fetched
+    for key in (buyer_quote_key, seller_base_key):
+        initialized_engine.vault_balances[key] = 2000000000  # 200 XLM
+        initialized_engine._balance_fetched_at[key] = time.monotonic()
 
     # Buy order
-    buy_order = Order(
-        order_id="buy-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    buy_order = make_order(order_id="buy-001")
 
     # Sell order
-    sell_order = Order(
+    sell_order = make_order(
         order_id="sell-001",
         user_address=user2_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
         side=OrderSide.Sell,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567891,
-        signature="sig"
+        timestamp=1234567891
     )
 
-    await engine.submit_order(buy_order)
-    await engine.submit_order(sell_order)
+    await initialized_engine.submit_order(buy_order)
+    await initialized_engine.submit_order(sell_order)
 
-    # Check that balances were updated
+    # Check that balances were updated (amounts in stroops, 10^7 per unit)
     # Buyer should have less quote asset (paid 100 * 1.5 = 150)
-    expected_buyer_quote_decrease = int(Decimal("150") * Decimal("10000000"))
-    assert engine.vault_balances[buyer_quote_key] == 2000000000 - expected_buyer_quote_decrease
+    expected_buyer_quote_decrease = 1_500_000_000
+    assert initialized_engine.vault_balances[buyer_quote_key] == 2000000000 - expected_buyer_quote_decrease
 
     # Seller should have less base asset (sold 100)
-    expected_seller_base_decrease = int(Decimal("100") * Decimal("10000000"))
-    assert engine.vault_balances[seller_base_key] == 2000000000 - expected_seller_base_decrease
+    expected_seller_base_decrease = 1_000_000_000
+    assert initialized_engine.vault_balances[seller_base_key] == 2000000000 - expected_seller_base_decrease
 
 
-@pytest.mark.asyncio
-async def test_cancel_order(mock_stellar_service, user1_keypair):
+async def test_cancel_order(initialized_engine, make_order):
     """Test canceling an order."""
-    engine = MatchingEngine()
-    await engine.initialize()
-
-    order = Order(
-        order_id="test-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    order = make_order(order_id="test-001")
 
-    await engine.submit_order(order)
+    await initialized_engine.submit_order(order)
 
-    await engine.cancel_order(
+    await initialized_engine.cancel_order(
         order.order_id,
         order.user_address,
         AssetPair(base="XLM", quote="USDC")
     )
 
     # Verify order is cancelled
-    retrieved = await engine.get_order(order.order_id, order.asset_pair)
+    retrieved = await initialized_engine.get_order(order.order_id, order.asset_pair)
     assert retrieved is not None
     assert retrieved.status.value == "Cancelled"
 
 
-@pytest.mark.asyncio
-async def test_get_orderbook_snapshot(mock_stellar_service, user1_keypair):
+async def test_get_orderbook_snapshot(initialized_engine, make_order):
     """Test getting orderbook snapshot."""
-    engine = MatchingEngine()
-    await engine.initialize()
-
     # Add some orders
-    for i in range(3):
-        order = Order(
+    for i, price in enumerate(PRICES):
+        order = make_order(
             order_id=f"order-{i}",
-            user_address=user1_keypair.public_key,
-            asset_pair=AssetPair(base="XLM", quote="USDC"),
-            side=OrderSide.Buy,
-            order_type=OrderType.Limit,
-            price=Decimal(f"{1.0 + i * 0.1}"),
-            quantity=Decimal("100"),
-            time_in_force=TimeInForce.GTC,
-            timestamp=1234567890 + i,
-            signature="sig"
+            price=price,
+            timestamp=1234567890 + i
         )
-        await engine.submit_order(order)
+        await initialized_engine.submit_order(order)
 
-    snapshot = await engine.get_orderbook_snapshot(AssetPair(base="XLM", quote="USDC"))
+    snapshot = await initialized_engine.get_orderbook_snapshot(AssetPair(base="XLM", quote="USDC"))
 
     assert len(snapshot.bids) == 3
     assert len(snapshot.asks) == 0
     assert snapshot.timestamp > 0
 
 
-@pytest.mark.asyncio
-async def test_buy_order_balance_check_quote_asset(mock_stellar_service, user1_keypair):
+async def test_buy_order_balance_check_quote_asset(mock_stellar_service, initialized_engine, make_order):
     """Test that buy orders check quote asset balance."""
-    engine = MatchingEngine()
-    await engine.initialize()
-
     # For buy order at price 1.5 and quantity 100, needs 150 quote asset
     # Set quote balance to insufficient (100 stroops = 0.00001 XLM)
     mock_stellar_service.get_vault_balance = AsyncMock(return_value=100)
 
-    order = Order(
-        order_id="buy-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Buy,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    order = make_order(order_id="buy-001")
 
     with pytest.raises(ValueError, match="Insufficient vault balance"):
-        await engine.submit_order(order)
+        await initialized_engine.submit_order(order)
 
 
-@pytest.mark.asyncio
-async def test_sell_order_balance_check_base_asset(mock_stellar_service, user1_keypair):
+async def test_sell_order_balance_check_base_asset(mock_stellar_service, initialized_engine, make_order):
     """Test that sell orders check base asset balance."""
-    engine = MatchingEngine()
-    await engine.initialize()
-
     # For sell order, needs base asset
     mock_stellar_service.get_vault_balance = AsyncMock(return_value=100)
 
-    order = Order(
-        order_id="sell-001",
-        user_address=user1_keypair.public_key,
-        asset_pair=AssetPair(base="XLM", quote="USDC"),
-        side=OrderSide.Sell,
-        order_type=OrderType.Limit,
-        price=Decimal("1.5"),
-        quantity=Decimal("100"),
-        time_in_force=TimeInForce.GTC,
-        timestamp=1234567890,
-        signature="sig"
-    )
+    order = make_order(order_id="sell-001", side=OrderSide.Sell)
 
     with pytest.raises(ValueError, match="Insufficient vault balance"):
-        await engine.submit_order(order)
+        await initialized_engine.submit_order(order)
+
+
+async def test_concurrent_balance_misses_share_one_fetch(mock_stellar_service, initialized_engine, user1_keypair):
+    """Test that concurrent cache misses for the same vault balance issue a single RPC."""
+    async def slow_balance(user, asset):
+        await asyncio.sleep(0.01)
+        return 5000000000
+
+    mock_stellar_service.get_vault_balance = AsyncMock(side_effect=slow_balance)
+    contract_id = mock_stellar_service.get_contract_address("USDC")
+
+    results = await asyncio.gather(*[
+        initialized_engine.get_vault_balance(user1_keypair.public_key, contract_id) for _ in range(5)
+    ])
+
+    assert [balance for balance, _ in results] == [5000000000] * 5
+    assert mock_stellar_service.get_vault_balance.await_count == 1
+    assert await initialized_engine.get_vault_balance(user1_keypair.public_key, contract_id) == (5000000000, True)
+
+
+async def test_orderbook_snapshot_reused_until_book_changes(initialized_engine, user1_keypair, make_order):
+    """Test that the snapshot is rebuilt only after the book is mutated."""
+    asset_pair = AssetPair(base="XLM", quote="USDC")
+
+    order = make_order(order_id="snap-001", price=Decimal("1.0"))
+    await initialized_engine.submit_order(order)
+
+    first = await initialized_engine.get_orderbook_snapshot(asset_pair)
+    second = await initialized_engine.get_orderbook_snapshot(asset_pair)
+    assert second.bids == first.bids
+
+    await initialized_engine.cancel_order("snap-001", user1_keypair.public_key, asset_pair)
+    third = await initialized_engine.get_orderbook_snapshot(asset_pair)
+    assert len(third.bids) == 0
+
+
+async def test_trades_settle_in_background(mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that settlement runs off the order path and clears pending deltas once confirmed."""
+    for order_id, user, side in (
+        ("bg-buy", user1_keypair.public_key, OrderSide.Buy),
+        ("bg-sell", user2_keypair.public_key, OrderSide.Sell),
+    ):
+        await initialized_engine.submit_order(make_order(
+            order_id=order_id,
+            user_address=user,
+            side=side,
+            quantity=Decimal("10")
+        ))
+
+    # Matched locally; the deltas are pending until the settlement lands
+    assert initialized_engine._pending_deltas[(user1_keypair.public_key, initialized_engine.base_asset)] == 100000000
+
+    await initialized_engine._settle_q.join()
+
+    mock_stellar_service.sign_and_submit_settlement.assert_awaited_once()
+    assert initialized_engine._pending_deltas == {}
+
+
+async def _match_pair(engine, buyer, seller, make_order, prefix="pair"):
+    for order_id, user, side in ((f"{prefix}-buy", buyer, OrderSide.Buy), (f"{prefix}-sell", seller, OrderSide.Sell)):
+        await engine.submit_order(make_order(order_id=order_id, user_address=user, side=side, quantity=Decimal("10")))
+
+
+async def test_failed_settlement_is_retried(monkeypatch, mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that a settlement failing before it lands is retried and then releases its deltas."""
+    monkeypatch.setattr(settings, "settlement_retry_backoff", 0)
+    mock_stellar_service.sign_and_submit_settlement = AsyncMock(side_effect=[ValueError("Simulation failed"), "tx-hash-123"])
+
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order)
+    await initialized_engine._settle_q.join()
+
+    assert mock_stellar_service.sign_and_submit_settlement.await_count == 2
+    assert initialized_engine._pending_deltas == {}
+    assert initialized_engine._unsettled == {}
+    assert not initialized_engine.failed_settlements
+
+
+@pytest.mark.parametrize("error, attempts", [
+    (ValueError("Transaction failed on-chain"), 3),
+    # Unconfirmed after submission: a resubmission could settle twice
+    (TimeoutError("Transaction polling timed out"), 1),
+])
+async def test_abandoned_settlement_falls_back_to_chain(monkeypatch, mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order, error, attempts):
+    """Test that a settlement given up on releases its deltas and drops the balances it touched."""
+    monkeypatch.setattr(settings, "settlement_max_attempts", 3)
+    monkeypatch.setattr(settings, "settlement_retry_backoff", 0)
+    mock_stellar_service.sign_and_submit_settlement = AsyncMock(side_effect=error)
+
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order)
+    key = (user1_keypair.public_key, initialized_engine.quote_asset)
+    assert key in initialized_engine.vault_balances
+
+    await initialized_engine._settle_q.join()
+
+    assert mock_stellar_service.sign_and_submit_settlement.await_count == attempts
+    assert initialized_engine._pending_deltas == {}
+    assert [t.buy_user for t in initialized_engine.failed_settlements] == [user1_keypair.public_key]
+    # Re-read from the chain rather than trusting the locally applied trade
+    assert key not in initialized_engine.vault_balances
+
+
+async def test_clear_balance_cache_rebuilds_pending_deltas(mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that clearing the cache drops ledger drift but keeps trades still awaiting settlement."""
+    release = asyncio.Event()
+
+    async def slow_settlement(instruction):
+        await release.wait()
+        return "tx-hash-123"
+
+    mock_stellar_service.sign_and_submit_settlement = AsyncMock(side_effect=slow_settlement)
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order)
+    expected = dict(initialized_engine._pending_deltas)
+    initialized_engine._pending_deltas[("GSTALE", initialized_engine.base_asset)] = 42
+
+    initialized_engine.clear_balance_cache()
+
+    assert initialized_engine._pending_deltas == expected
+    assert len(initialized_engine.vault_balances) == 0
+
+    release.set()
+    await initialized_engine._settle_q.join()
+    assert initialized_engine._pending_deltas == {}
+
+
+async def test_balance_fetched_during_settlement_is_not_double_counted(mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that a chain read racing an in-flight settlement takes the lower reading and stays stale."""
+    release = asyncio.Event()
+
+    async def slow_settlement(instruction):
+        await release.wait()
+        return "tx-hash-123"
+
+    mock_stellar_service.sign_and_submit_settlement = AsyncMock(side_effect=slow_settlement)
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order)
+    await asyncio.sleep(0)
+
+    # The buyer's base credit has already landed on-chain, but the poll hasn't returned
+    key = (user1_keypair.public_key, initialized_engine.base_asset)
+    credit = initialized_engine._pending_deltas[key]
+    assert initialized_engine._settling[key] == credit
+    mock_stellar_service.get_vault_balance = AsyncMock(return_value=1000000000000 + credit)
+    initialized_engine.vault_balances.pop(key, None)
+
+    balance, cached = await initialized_engine.get_vault_balance(*key)
+
+    assert (balance, cached) == (1000000000000 + credit, False)
+    assert key not in initialized_engine._balance_fetched_at
+
+    release.set()
+    await initialized_engine._settle_q.join()
+
+
+async def test_aclose_drains_queued_settlements(mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that shutting the engine down settles queued trades before stopping the worker."""
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order)
+    task = initialized_engine._settle_task
+
+    await initialized_engine.aclose()
+
+    mock_stellar_service.sign_and_submit_settlement.assert_awaited_once()
+    assert initialized_engine._pending_deltas == {}
+    assert task.done()
+
+
+async def test_restarted_settlement_worker_keeps_unsettled_trades(mock_stellar_service, initialized_engine, user1_keypair, user2_keypair, make_order):
+    """Test that replacing a dead settlement worker does not drop trades queued behind it."""
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order, prefix="first")
+    initialized_engine._settle_task.cancel()
+    await asyncio.sleep(0)
+
+    await _match_pair(initialized_engine, user1_keypair.public_key, user2_keypair.public_key, make_order, prefix="second")
+    await initialized_engine._settle_q.join()
+
+    assert mock_stellar_service.sign_and_submit_settlement.await_count == 2
+    assert initialized_engine._unsettled == {}
+    assert initialized_engine._pending_deltas == {}
+
+
+async def test_stale_cached_balance_refreshes_in_background(mock_stellar_service, initialized_engine, user1_keypair):
+    """Test that a cache hit past half the TTL is served immediately and re-fetched behind it."""
+    key = (user1_keypair.public_key, initialized_engine.quote_asset)
+
+    initialized_engine.vault_balances[key] = 100
+    initialized_engine._balance_fetched_at[key] = time.monotonic() - 3600
+    mock_stellar_service.get_vault_balance = AsyncMock(return_value=250)
+
+    assert await initialized_engine.get_vault_balance(*key) == (100, True)
+
+    await asyncio.gather(*initialized_engine._refresh_tasks)
+    mock_stellar_service.get_vault_balance.assert_awaited_once()
+    assert initialized_engine.vault_balances[key] == 250
+
+
+async def test_balance_refetched_after_ttl_while_trades_land(mock_stellar_service, initialized_engine, user1_keypair):
+    """Test that trade updates keeping a balance cached do not stop it being re-fetched."""
+    key = (user1_keypair.public_key, initialized_engine.quote_asset)
+
+    initialized_engine.vault_balances[key] = 100
+    initialized_engine._balance_fetched_at[key] = time.monotonic()
+
+    # Trades keep rewriting the balance while the clock passes the TTL
+    initialized_engine._update_local_balance(*key, -10)
+    initialized_engine._balance_fetched_at.expire(time.monotonic() + settings.balance_cache_ttl + 1)
+    initialized_engine._update_local_balance(*key, -10)
+    mock_stellar_service.get_vault_balance = AsyncMock(return_value=500)
+
+    assert await initialized_engine.get_vault_balance(*key) == (80, True)
+
+    await asyncio.gather(*initialized_engine._refresh_tasks)
+    mock_stellar_service.get_vault_balance.assert_awaited_once()
+    assert initialized_engine.vault_balances[key] == 500
+
+
+async def test_cancelled_balance_fetch_does_not_fail_waiters(mock_stellar_service, initialized_engine, user1_keypair):
+    """Test that cancelling the request that owns a shared fetch lets the other waiters finish."""
+    release = asyncio.Event()
+
+    async def slow_balance(user, asset):
+        await release.wait()
+        return 5000000000
+
+    mock_stellar_service.get_vault_balance = AsyncMock(side_effect=slow_balance)
+    key = (user1_keypair.public_key, initialized_engine.quote_asset)
+
+    owner = asyncio.create_task(initialized_engine.get_vault_balance(*key))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(initialized_engine.get_vault_balance(*key)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    owner.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert [balance for balance, _ in await asyncio.gather(*waiters)] == [5000000000] * 3
+    assert owner.cancelled()
+    # One waiter took over the fetch; the rest shared it
+    assert mock_stellar_service.get_vault_balance.await_count == 2
@@ -4,10 +4,20 @@ Unit tests for OrderBook matching logic.
 import pytest
 from decimal import Decimal
 
-from src.types import Order, OrderSide, OrderType, TimeInForce, OrderStatus, AssetPair
+from src.types import Order, OrderSide, OrderType, TimeInForce, OrderStatus, AssetPair, STROOPS_PER_UNIT
+
+
+@pytest.fixture(params=["match_order", "match_order_sync"])
+def match(request, orderbook):
+    """Matching entry point under test: the async wrapper or the sync core it calls."""
+    if request.param == "match_order":
+        return orderbook.match_order
+
+    async def match_sync(order):
+        return orderbook.match_order_sync(order)
+    return match_sync
 
 
-@pytest.mark.asyncio
 async def test_empty_orderbook_snapshot(orderbook):
     """Test getting snapshot of empty orderbook."""
     snapshot = await orderbook.get_snapshot()
@@ -18,55 +28,62 @@ async def test_empty_orderbook_snapshot(orderbook):
     assert snapshot.timestamp > 0
 
 
-@pytest.mark.asyncio
 async def test_add_buy_order_no_match(orderbook, buy_order):
     """Test adding a buy order when no matching sell orders exist."""
     trades = await orderbook.match_order(buy_order)
 
     assert len(trades) == 0
     assert buy_order.status == OrderStatus.Pending
-    assert buy_order.filled_quantity == Decimal("0")
+    assert buy_order.filled_scaled == 0
     assert len(orderbook.bids) == 1
-    assert orderbook.bids[buy_order.price][0] == buy_order
+    assert orderbook.bids[buy_order.price_scaled].head is buy_order
+
+
+async def test_snapshot_converts_scaled_amounts(orderbook, buy_order):
+    """Test that snapshot levels report decimal amounts converted from stroops."""
+    await orderbook.match_order(buy_order)
+
+    snapshot = await orderbook.get_snapshot()
+
+    assert buy_order.price_scaled == 15000000
+    assert str(snapshot.bids[0].price) == "1.5"
+    assert str(snapshot.bids[0].quantity) == "100"
 
 
-@pytest.mark.asyncio
 async def test_add_sell_order_no_match(orderbook, sell_order):
     """Test adding a sell order when no matching buy orders exist."""
     trades = await orderbook.match_order(sell_order)
 
     assert len(trades) == 0
     assert sell_order.status == OrderStatus.Pending
-    assert sell_order.filled_quantity == Decimal("0")
+    assert sell_order.filled_scaled == 0
     assert len(orderbook.asks) == 1
-    assert orderbook.asks[sell_order.price][0] == sell_order
+    assert orderbook.asks[sell_order.price_scaled].head is sell_order
 
 
-@pytest.mark.asyncio
-async def test_full_match_buy_sell(orderbook, buy_order, sell_order):
+async def test_full_match_buy_sell(orderbook, match, buy_order, sell_order):
     """Test full match between buy and sell orders."""
     # Add buy order first
-    await orderbook.match_order(buy_order)
+    await match(buy_order)
 
     # Add matching sell order
-    trades = await orderbook.match_order(sell_order)
+    trades = await match(sell_order)
 
     assert len(trades) == 1
     trade = trades[0]
 
-    assert trade.quantity == Decimal("100")
-    assert trade.price == buy_order.price
+    assert trade.qty_scaled == 100 * STROOPS_PER_UNIT
+    assert trade.price_scaled == buy_order.price_scaled
     assert trade.buy_user == buy_order.user_address
     assert trade.sell_user == sell_order.user_address
 
     assert buy_order.status == OrderStatus.Filled
     assert sell_order.status == OrderStatus.Filled
-    assert buy_order.filled_quantity == Decimal("100")
-    assert sell_order.filled_quantity == Decimal("100")
+    assert buy_order.filled_scaled == 100 * STROOPS_PER_UNIT
+    assert sell_order.filled_scaled == 100 * STROOPS_PER_UNIT
 
 
-@pytest.mark.asyncio
-async def test_partial_match(orderbook, asset_pair, user1_keypair, user2_keypair):
+async def test_partial_match(orderbook, match, asset_pair, user1_keypair, user2_keypair):
     """Test partial order fill."""
     # Large buy order
     buy = Order(
@@ -96,24 +113,24 @@ async def test_partial_match(orderbook, asset_pair, user1_keypair, user2_keypair
         signature="sig"
     )
 
-    await orderbook.match_order(buy)
-    trades = await orderbook.match_order(sell)
+    await match(buy)
+    trades = await match(sell)
 
     assert len(trades) == 1
-    assert trades[0].quantity == Decimal("50")
+    assert trades[0].qty_scaled == 50 * STROOPS_PER_UNIT
 
     assert buy.status == OrderStatus.PartiallyFilled
-    assert buy.filled_quantity == Decimal("50")
+    assert buy.filled_scaled == 50 * STROOPS_PER_UNIT
     assert sell.status == OrderStatus.Filled
-    assert sell.filled_quantity == Decimal("50")
+    assert sell.filled_scaled == 50 * STROOPS_PER_UNIT
 
     # Buy order should still be in book
     assert len(orderbook.bids) == 1
-    assert orderbook.bids[buy.price][0].order_id == buy.order_id
+    assert orderbook.bids[buy.price_scaled].head.order_id == buy.order_id
+    assert orderbook.bids[buy.price_scaled].agg_qty == 150 * STROOPS_PER_UNIT
 
 
-@pytest.mark.asyncio
-async def test_price_priority(orderbook, asset_pair, user1_keypair, user2_keypair):
+async def test_price_priority(orderbook, match, asset_pair, user1_keypair, user2_keypair):
     """Test that best price is matched first."""
     # Add multiple sell orders at different prices
     sell_low = Order(
@@ -142,8 +159,8 @@ async def test_price_priority(orderbook, asset_pair, user1_keypair, user2_keypai
         signature="sig"
     )
 
-    await orderbook.match_order(sell_high)
-    await orderbook.match_order(sell_low)
+    await match(sell_high)
+    await match(sell_low)
 
     # Now submit buy order that can match both
     buy = Order(
@@ -159,16 +176,19 @@ async def test_price_priority(orderbook, asset_pair, user1_keypair, user2_keypai
         signature="sig"
     )
 
-    trades = await orderbook.match_order(buy)
+    trades = await match(buy)
 
     # Should match with sell_low first (better price)
     assert len(trades) == 2
-    assert trades[0].price == Decimal("1.0")
-    assert trades[1].price == Decimal("2.0")
+    assert trades[0].price_scaled == 1 * STROOPS_PER_UNIT
+    assert trades[1].price_scaled == 2 * STROOPS_PER_UNIT
+
+    # Trade IDs are unique 32-hex-char handles (settled on-chain as bytes32)
+    assert trades[0].trade_id != trades[1].trade_id
+    assert all(len(bytes.fromhex(t.trade_id)) == 16 for t in trades)
 
 
-@pytest.mark.asyncio
-async def test_time_priority(orderbook, asset_pair, user1_keypair, user2_keypair):
+async def test_time_priority(orderbook, match, asset_pair, user1_keypair, user2_keypair):
     """Test that earlier orders are matched first at same price."""
     # Add two sell orders at same price
     sell_first = Order(
@@ -197,8 +217,8 @@ async def test_time_priority(orderbook, asset_pair, user1_keypair, user2_keypair
         signature="sig"
     )
 
-    await orderbook.match_order(sell_first)
-    await orderbook.match_order(sell_second)
+    await match(sell_first)
+    await match(sell_second)
 
     # Submit buy order matching only first
     buy = Order(
@@ -214,7 +234,7 @@ async def test_time_priority(orderbook, asset_pair, user1_keypair, user2_keypair
         signature="sig"
     )
 
-    trades = await orderbook.match_order(buy)
+    trades = await match(buy)
 
     # Should match with sell_first
     assert len(trades) == 1
@@ -223,7 +243,6 @@ async def test_time_priority(orderbook, asset_pair, user1_keypair, user2_keypair
     assert sell_second.status == OrderStatus.Pending
 
 
-@pytest.mark.asyncio
 async def test_cancel_order(orderbook, buy_order):
     """Test canceling an order."""
     await orderbook.match_order(buy_order)
@@ -234,7 +253,55 @@ async def test_cancel_order(orderbook, buy_order):
     assert len(orderbook.bids) == 0
 
 
-@pytest.mark.asyncio
+async def test_cancel_order_mid_level_keeps_time_priority(orderbook, asset_pair, user1_keypair):
+    """Test canceling an order in the middle of a price level leaves the others in FIFO order."""
+    orders = []
+    for i in range(3):
+        order = Order(
+            order_id=f"buy-{i}",
+            user_address=user1_keypair.public_key,
+            asset_pair=asset_pair,
+            side=OrderSide.Buy,
+            order_type=OrderType.Limit,
+            price=Decimal("1.5"),
+            quantity=Decimal("10"),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890 + i
+        )
+        await orderbook.match_order(order)
+        orders.append(order)
+
+    await orderbook.cancel_order("buy-1", user1_keypair.public_key)
+    # Cancelling twice is a no-op
+    await orderbook.cancel_order("buy-1", user1_keypair.public_key)
+
+    level = orderbook.bids[orders[0].price_scaled]
+    assert [o.order_id for o in level] == ["buy-0", "buy-2"]
+    assert level.tail is orders[2]
+    assert level.agg_qty == 20 * STROOPS_PER_UNIT
+
+
+async def test_cancel_order_not_resting_leaves_level_untouched(orderbook, make_order, user2_keypair):
+    """Test canceling an IOC remainder that never rested does not touch the level at its price."""
+    await orderbook.match_order(make_order(
+        order_id="sell-small",
+        user_address=user2_keypair.public_key,
+        side=OrderSide.Sell,
+        quantity=Decimal("5")
+    ))
+    ioc = make_order(order_id="buy-ioc", time_in_force=TimeInForce.IOC)
+    await orderbook.match_order(ioc)
+    # Rests at the same price the IOC order was submitted at
+    resting = make_order(order_id="buy-rest", quantity=Decimal("10"))
+    await orderbook.match_order(resting)
+
+    await orderbook.cancel_order("buy-ioc", ioc.user_address)
+
+    level = orderbook.bids[resting.price_scaled]
+    assert [o.order_id for o in level] == ["buy-rest"]
+    assert level.agg_qty == 10 * STROOPS_PER_UNIT
+
+
 async def test_cancel_unauthorized(orderbook, buy_order, user2_keypair):
     """Test that users can't cancel other users' orders."""
     await orderbook.match_order(buy_order)
@@ -243,8 +310,7 @@ async def test_cancel_unauthorized(orderbook, buy_order, user2_keypair):
         await orderbook.cancel_order(buy_order.order_id, user2_keypair.public_key)
 
 
-@pytest.mark.asyncio
-async def test_ioc_order_partial_fill(orderbook, asset_pair, user1_keypair, user2_keypair):
+async def test_ioc_order_partial_fill(orderbook, match, asset_pair, user1_keypair, user2_keypair):
     """Test IOC (Immediate or Cancel) order behavior."""
     # Add small sell order
     sell = Order(
@@ -260,7 +326,7 @@ async def test_ioc_order_partial_fill(orderbook, asset_pair, user1_keypair, user
         signature="sig"
     )
 
-    await orderbook.match_order(sell)
+    await match(sell)
 
     # IOC buy order for more than available
     buy_ioc = Order(
@@ -276,18 +342,17 @@ async def test_ioc_order_partial_fill(orderbook, asset_pair, user1_keypair, user
         signature="sig"
     )
 
-    trades = await orderbook.match_order(buy_ioc)
+    trades = await match(buy_ioc)
 
     # Should match 50 but not add remainder to book
     assert len(trades) == 1
-    assert trades[0].quantity == Decimal("50")
-    assert buy_ioc.filled_quantity == Decimal("50")
+    assert trades[0].qty_scaled == 50 * STROOPS_PER_UNIT
+    assert buy_ioc.filled_scaled == 50 * STROOPS_PER_UNIT
     assert buy_ioc.status == OrderStatus.PartiallyFilled
     assert len(orderbook.bids) == 0  # IOC not added to book
 
 
-@pytest.mark.asyncio
-async def test_limit_order_price_check(orderbook, asset_pair, user1_keypair, user2_keypair):
+async def test_limit_order_price_check(orderbook, match, asset_pair, user1_keypair, user2_keypair):
     """Test that limit orders don't match at unfavorable prices."""
     # Add sell order at 2.0
     sell = Order(
@@ -303,7 +368,7 @@ async def test_limit_order_price_check(orderbook, asset_pair, user1_keypair, use
         signature="sig"
     )
 
-    await orderbook.match_order(sell)
+    await match(sell)
 
     # Buy order with limit price below sell price
     buy = Order(
@@ -319,7 +384,7 @@ async def test_limit_order_price_check(orderbook, asset_pair, user1_keypair, use
         signature="sig"
     )
 
-    trades = await orderbook.match_order(buy)
+    trades = await match(buy)
 
     # Should not match
     assert len(trades) == 0
@@ -327,7 +392,6 @@ async def test_limit_order_price_check(orderbook, asset_pair, user1_keypair, use
     assert len(orderbook.asks) == 1
 
 
-@pytest.mark.asyncio
 async def test_orderbook_snapshot_with_orders(orderbook, asset_pair, user1_keypair, user2_keypair):
     """Test orderbook snapshot with multiple price levels."""
     # Add multiple orders
@@ -372,3 +436,144 @@ async def test_orderbook_snapshot_with_orders(orderbook, asset_pair, user1_keypa
     # Asks should be in ascending order
     for i in range(len(snapshot.asks) - 1):
         assert snapshot.asks[i].price < snapshot.asks[i + 1].price
+
+
+async def test_snapshot_cached_until_top_levels_change(orderbook, asset_pair, user1_keypair):
+    """Test that the snapshot is only rebuilt when a change lands in the top 20 levels."""
+    def bid(order_id, price):
+        return Order(
+            order_id=order_id,
+            user_address=user1_keypair.public_key,
+            asset_pair=asset_pair,
+            side=OrderSide.Buy,
+            order_type=OrderType.Limit,
+            price=Decimal(price),
+            quantity=Decimal("10"),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890
+        )
+
+    for i in range(20):
+        await orderbook.match_order(bid(f"buy-{i}", f"{10 + i}"))
+
+    snapshot = await orderbook.get_snapshot()
+    assert await orderbook.get_snapshot() is snapshot
+
+    # Below the 20th best bid: invisible in the snapshot, cache kept
+    await orderbook.match_order(bid("deep", "1"))
+    assert await orderbook.get_snapshot() is snapshot
+
+    # New best bid: snapshot rebuilt
+    await orderbook.match_order(bid("best", "50"))
+    rebuilt = await orderbook.get_snapshot()
+    assert rebuilt is not snapshot
+    assert rebuilt.bids[0].price == Decimal("50")
+    assert len(rebuilt.bids) == 20
+
+
+async def test_snapshot_delta_reports_touched_levels(orderbook, asset_pair, user1_keypair, user2_keypair):
+    """Test that deltas carry only levels changed since the last call."""
+    def order(order_id, user, side, price, quantity):
+        return Order(
+            order_id=order_id,
+            user_address=user.public_key,
+            asset_pair=asset_pair,
+            side=side,
+            order_type=OrderType.Limit,
+            price=Decimal(price),
+            quantity=Decimal(quantity),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890
+        )
+
+    # An unwatched book tracks nothing; the first call starts tracking
+    await orderbook.match_order(order("sell-0", user1_keypair, OrderSide.Sell, "110", "1"))
+    await orderbook.cancel_order("sell-0", user1_keypair.public_key)
+    assert orderbook._dirty_levels is None
+    assert (await orderbook.get_snapshot_delta()).changes == ()
+
+    await orderbook.match_order(order("sell-1", user1_keypair, OrderSide.Sell, "100", "10"))
+    await orderbook.match_order(order("buy-1", user1_keypair, OrderSide.Buy, "90", "5"))
+
+    delta = await orderbook.get_snapshot_delta()
+    changes = {(c.side, c.price): c.quantity for c in delta.changes}
+    assert changes == {
+        (OrderSide.Sell, Decimal("100")): Decimal("10"),
+        (OrderSide.Buy, Decimal("90")): Decimal("5"),
+    }
+    assert (await orderbook.get_snapshot_delta()).changes == ()
+
+    # Partial fill shrinks the ask; the untouched bid is not reported
+    await orderbook.match_order(order("buy-2", user2_keypair, OrderSide.Buy, "100", "4"))
+    delta = await orderbook.get_snapshot_delta()
+    assert [(c.side, c.price, c.quantity) for c in delta.changes] == [
+        (OrderSide.Sell, Decimal("100"), Decimal("6"))
+    ]
+
+    # Cancelling the last order at a level reports it as removed
+    await orderbook.cancel_order("buy-1", user1_keypair.public_key)
+    delta = await orderbook.get_snapshot_delta()
+    assert [(c.side, c.price, c.quantity) for c in delta.changes] == [
+        (OrderSide.Buy, Decimal("90"), Decimal("0"))
+    ]
+
+
+async def test_sweep_across_levels(orderbook, match, asset_pair, user1_keypair, user2_keypair):
+    """Test that a large order walks several levels and stops at its limit."""
+    for i, price in enumerate(["100", "101", "102", "110"]):
+        await match(Order(
+            order_id=f"sell-{i}",
+            user_address=user1_keypair.public_key,
+            asset_pair=asset_pair,
+            side=OrderSide.Sell,
+            order_type=OrderType.Limit,
+            price=Decimal(price),
+            quantity=Decimal("10"),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890
+        ))
+
+    sweep = Order(
+        order_id="sweep",
+        user_address=user2_keypair.public_key,
+        asset_pair=asset_pair,
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("105"),
+        quantity=Decimal("25"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+    trades = await match(sweep)
+
+    assert [t.price_scaled for t in trades] == [p * STROOPS_PER_UNIT for p in (100, 101, 102)]
+    assert sum(t.qty_scaled for t in trades) == 25 * STROOPS_PER_UNIT
+    assert sweep.status == OrderStatus.Filled
+
+    # Two exhausted levels are gone; the third keeps its remainder
+    assert [price for price, _ in orderbook.asks.items()] == [102 * STROOPS_PER_UNIT, 110 * STROOPS_PER_UNIT]
+    assert orderbook.asks[102 * STROOPS_PER_UNIT].agg_qty == 5 * STROOPS_PER_UNIT
+
+
+async def test_best_level_tracks_inserts_and_cancels(orderbook, asset_pair, user1_keypair):
+    """Test that the cached best bid follows new better prices and cancellation of the top."""
+    best_prices = []
+    for order_id, price in (("bid-2", "2"), ("bid-1", "1"), ("bid-3", "3")):
+        await orderbook.match_order(Order(
+            order_id=order_id,
+            user_address=user1_keypair.public_key,
+            asset_pair=asset_pair,
+            side=OrderSide.Buy,
+            order_type=OrderType.Limit,
+            price=Decimal(price),
+            quantity=Decimal("1"),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890
+        ))
+        best_prices.append(orderbook.bids.best()[0])
+
+    assert best_prices == [2 * STROOPS_PER_UNIT, 2 * STROOPS_PER_UNIT, 3 * STROOPS_PER_UNIT]
+
+    await orderbook.cancel_order("bid-3", user1_keypair.public_key)
+    assert orderbook.bids.best()[0] == 2 * STROOPS_PER_UNIT
+    assert 3 * STROOPS_PER_UNIT not in orderbook.bids
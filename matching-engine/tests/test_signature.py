@@ -3,12 +3,13 @@ Unit tests for order signature verification.
 """
 import pytest
 import json
-import base64
+import binascii
 import hashlib
 from decimal import Decimal
-from stellar_sdk import Keypair
+from stellar_sdk import Asset, Network
 
 from src.stellar import StellarService
+from src.batcher import SignatureBatcher
 from src.types import Order, OrderSide, OrderType, TimeInForce, AssetPair
 
 
@@ -59,14 +60,28 @@ def test_create_order_message_with_expiration():
     assert "expiration:1234577890" in message
 
 
-def test_sign_and_verify_order():
+def test_get_contract_address_is_network_specific():
+    """Test cached contract IDs are derived per network passphrase."""
+    testnet = StellarService()
+    testnet.network_passphrase = Network.TESTNET_NETWORK_PASSPHRASE
+    public = StellarService()
+    public.network_passphrase = Network.PUBLIC_NETWORK_PASSPHRASE
+
+    assert testnet.get_contract_address("XLM") == Asset.native().contract_id(Network.TESTNET_NETWORK_PASSPHRASE)
+    assert public.get_contract_address("native") == Asset.native().contract_id(Network.PUBLIC_NETWORK_PASSPHRASE)
+    assert testnet.get_contract_address("XLM") != public.get_contract_address("XLM")
+
+    with pytest.raises(ValueError):
+        testnet.get_contract_address("not-an-asset")
+
+
+def test_sign_and_verify_order(fresh_keypair):
     """Test signing an order and verifying the signature."""
     stellar_service = StellarService()
-    keypair = Keypair.random()
 
     order = Order(
         order_id="test-456",
-        user_address=keypair.public_key,
+        user_address=fresh_keypair.public_key,
         asset_pair=AssetPair(base="XLM", quote="USDC"),
         side=OrderSide.Buy,
         order_type=OrderType.Limit,
@@ -83,23 +98,59 @@ def test_sign_and_verify_order():
     full_message = (prefix + message).encode("utf-8")
     message_hash = hashlib.sha256(full_message).digest()
 
-    signature_bytes = keypair.sign(message_hash)
-    signature = base64.b64encode(signature_bytes).decode('ascii')
+    signature_bytes = fresh_keypair.sign(message_hash)
+    signature = binascii.b2a_base64(signature_bytes, newline=False).decode('ascii')
 
     # Verify
-    is_valid = stellar_service.verify_order_signature(order, signature, keypair.public_key)
+    is_valid = stellar_service.verify_order_signature(order, signature, fresh_keypair.public_key)
 
     assert is_valid
+    assert stellar_service.verify_order_signature_prehashed(message_hash, signature, fresh_keypair.public_key)
 
 
-def test_verify_invalid_signature():
+def test_batch_verify_matches_single(keypair_pool):
+    """Test that batch verification agrees with per-order verification over 64 orders."""
+    stellar_service = StellarService()
+    keypairs = keypair_pool[:4]
+
+    items = []
+    for i in range(64):
+        keypair = keypairs[i % len(keypairs)]
+        order = Order(
+            order_id=f"batch-{i}",
+            user_address=keypair.public_key,
+            asset_pair=AssetPair(base="XLM", quote="USDC"),
+            side=OrderSide.Buy if i % 2 else OrderSide.Sell,
+            order_type=OrderType.Limit,
+            price=Decimal("1.5"),
+            quantity=Decimal(i + 1),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890 + i
+        )
+        message_hash = hashlib.sha256(
+            ("Stellar Signed Message:\n" + stellar_service.create_order_message(order)).encode("utf-8")
+        ).digest()
+        signature = binascii.b2a_base64(keypair.sign(message_hash), newline=False).decode("ascii")
+        if i % 7 == 0:
+            signature = "not base64!"  # undecodable
+        elif i % 5 == 0:
+            keypair = keypairs[(i + 1) % len(keypairs)]  # wrong signer
+        items.append((order, signature, keypair.public_key))
+
+    batch = stellar_service.verify_order_signatures_batch(items)
+    single = [stellar_service.verify_order_signature(*item) for item in items]
+
+    assert batch == single
+    assert batch == [not (i % 7 == 0 or i % 5 == 0) for i in range(64)]
+
+
+def test_verify_invalid_signature(fresh_keypair):
     """Test that invalid signatures are rejected."""
     stellar_service = StellarService()
-    keypair = Keypair.random()
 
     order = Order(
         order_id="test-789",
-        user_address=keypair.public_key,
+        user_address=fresh_keypair.public_key,
         asset_pair=AssetPair(base="XLM", quote="USDC"),
         side=OrderSide.Buy,
         order_type=OrderType.Limit,
@@ -111,22 +162,46 @@ def test_verify_invalid_signature():
     )
 
     # Use wrong signature
-    fake_signature = base64.b64encode(b"fake" * 16).decode('ascii')
+    fake_signature = binascii.b2a_base64(b"fake" * 16, newline=False).decode('ascii')
 
-    is_valid = stellar_service.verify_order_signature(order, fake_signature, keypair.public_key)
+    is_valid = stellar_service.verify_order_signature(order, fake_signature, fresh_keypair.public_key)
 
     assert not is_valid
 
 
-def test_verify_signature_wrong_public_key():
+@pytest.mark.parametrize("signature", [
+    binascii.b2a_base64(b"short" * 6, newline=False).decode("ascii"),  # wrong length
+    "not*base64*at*all",  # invalid alphabet
+    "",
+])
+def test_malformed_signature_rejected_before_hashing(signature, fresh_keypair, monkeypatch):
+    """Test that malformed signatures are rejected without hashing the order."""
+    stellar_service = StellarService()
+    monkeypatch.setattr(stellar_service, "_signed_digest", lambda order: pytest.fail("order was hashed"))
+
+    order = Order(
+        order_id="test-malformed",
+        user_address=fresh_keypair.public_key,
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("1.5"),
+        quantity=Decimal("100"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+
+    assert not stellar_service.verify_order_signature(order, signature, fresh_keypair.public_key)
+    assert stellar_service.verify_order_signatures_batch([(order, signature, fresh_keypair.public_key)]) == [False]
+
+
+def test_verify_signature_wrong_public_key(fresh_keypair, other_keypair):
     """Test that signature verification fails with wrong public key."""
     stellar_service = StellarService()
-    keypair1 = Keypair.random()
-    keypair2 = Keypair.random()
 
     order = Order(
         order_id="test-999",
-        user_address=keypair1.public_key,
+        user_address=fresh_keypair.public_key,
         asset_pair=AssetPair(base="XLM", quote="USDC"),
         side=OrderSide.Buy,
         order_type=OrderType.Limit,
@@ -137,29 +212,29 @@ def test_verify_signature_wrong_public_key():
         signature=""
     )
 
-    # Sign with keypair1
+    # Sign with fresh_keypair
     message = stellar_service.create_order_message(order)
     prefix = "Stellar Signed Message:\n"
     full_message = (prefix + message).encode("utf-8")
     message_hash = hashlib.sha256(full_message).digest()
 
-    signature_bytes = keypair1.sign(message_hash)
-    signature = base64.b64encode(signature_bytes).decode('ascii')
+    signature_bytes = fresh_keypair.sign(message_hash)
+    signature = binascii.b2a_base64(signature_bytes, newline=False).decode('ascii')
 
-    # Verify with keypair2 (wrong key)
-    is_valid = stellar_service.verify_order_signature(order, signature, keypair2.public_key)
+    # Verify with other_keypair (wrong key)
+    is_valid = stellar_service.verify_order_signature(order, signature, other_keypair.public_key)
 
     assert not is_valid
+    assert not stellar_service.verify_order_signature_prehashed(message_hash, signature, other_keypair.public_key)
 
 
-def test_signature_tampering_detection():
+def test_signature_tampering_detection(fresh_keypair):
     """Test that signature verification detects order tampering."""
     stellar_service = StellarService()
-    keypair = Keypair.random()
 
     order = Order(
         order_id="test-tamper",
-        user_address=keypair.public_key,
+        user_address=fresh_keypair.public_key,
         asset_pair=AssetPair(base="XLM", quote="USDC"),
         side=OrderSide.Buy,
         order_type=OrderType.Limit,
@@ -176,13 +251,209 @@ def test_signature_tampering_detection():
     full_message = (prefix + message).encode("utf-8")
     message_hash = hashlib.sha256(full_message).digest()
 
-    signature_bytes = keypair.sign(message_hash)
-    signature = base64.b64encode(signature_bytes).decode('ascii')
+    signature_bytes = fresh_keypair.sign(message_hash)
+    signature = binascii.b2a_base64(signature_bytes, newline=False).decode('ascii')
 
     # Tamper with order (change quantity)
     order.quantity = Decimal("200")
 
     # Verify should fail
-    is_valid = stellar_service.verify_order_signature(order, signature, keypair.public_key)
+    is_valid = stellar_service.verify_order_signature(order, signature, fresh_keypair.public_key)
 
     assert not is_valid
+
+
+def test_tampering_detected_after_successful_verify(fresh_keypair):
+    """Test that a verified order re-verifies against its current fields, not a cached digest."""
+    stellar_service = StellarService()
+
+    order = Order(
+        order_id="test-tamper-after",
+        user_address=fresh_keypair.public_key,
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("1.5"),
+        quantity=Decimal("100"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+    message_hash = hashlib.sha256(
+        ("Stellar Signed Message:\n" + stellar_service.create_order_message(order)).encode("utf-8")
+    ).digest()
+    signature = binascii.b2a_base64(fresh_keypair.sign(message_hash), newline=False).decode('ascii')
+
+    assert stellar_service.verify_order_signature(order, signature, fresh_keypair.public_key)
+
+    order.quantity = Decimal("200")
+
+    assert not stellar_service.verify_order_signature(order, signature, fresh_keypair.public_key)
+    assert stellar_service.verify_order_signatures_batch([(order, signature, fresh_keypair.public_key)]) == [False]
+
+
+async def test_signature_batcher_coalesces_concurrent_orders(fresh_keypair):
+    """Test that concurrent verifications are coalesced and results routed back."""
+    import asyncio
+
+    stellar_service = StellarService()
+    calls = []
+
+    def verify_batch(items):
+        calls.append(len(items))
+        return stellar_service.verify_order_signatures_batch(items)
+
+    batcher = SignatureBatcher(verify_batch, window_ms=50, max_batch=8)
+
+    orders = []
+    signatures = []
+    for i in range(4):
+        order = Order(
+            order_id=f"batch-{i}",
+            user_address=fresh_keypair.public_key,
+            asset_pair=AssetPair(base="XLM", quote="USDC"),
+            side=OrderSide.Buy,
+            order_type=OrderType.Limit,
+            price=Decimal("1.5"),
+            quantity=Decimal("100"),
+            time_in_force=TimeInForce.GTC,
+            timestamp=1234567890,
+            signature=""
+        )
+        message = stellar_service.create_order_message(order)
+        message_hash = hashlib.sha256(("Stellar Signed Message:\n" + message).encode("utf-8")).digest()
+        orders.append(order)
+        signatures.append(binascii.b2a_base64(fresh_keypair.sign(message_hash), newline=False).decode('ascii'))
+
+    # Corrupt one signature
+    signatures[2] = signatures[1]
+
+    try:
+        results = await asyncio.gather(*(
+            batcher.verify(order, signature, fresh_keypair.public_key)
+            for order, signature in zip(orders, signatures)
+        ))
+    finally:
+        await batcher.aclose()
+
+    assert results == [True, True, False, True]
+    assert calls == [4]
+
+
+async def test_signature_batcher_falls_back_to_single_verify():
+    """Test that a failing batch call is retried item by item."""
+    import asyncio
+
+    def verify_batch(items):
+        raise RuntimeError("batch backend unavailable")
+
+    def verify_one(order, signature, public_key):
+        if signature == "boom":
+            raise ValueError("bad input")
+        return signature == "good"
+
+    batcher = SignatureBatcher(verify_batch, verify_one=verify_one, window_ms=50, max_batch=8)
+    order = Order(
+        order_id="fallback",
+        user_address="GUSER",
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("1.5"),
+        quantity=Decimal("100"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+
+    try:
+        results = await asyncio.gather(
+            batcher.verify(order, "good", "GUSER"),
+            batcher.verify(order, "bad", "GUSER"),
+            batcher.verify(order, "boom", "GUSER"),
+            return_exceptions=True
+        )
+    finally:
+        await batcher.aclose()
+
+    assert results[0] is True
+    assert results[1] is False
+    assert isinstance(results[2], ValueError)
+
+
+async def test_signature_batcher_short_batch_result_resolves_every_caller():
+    """Test that a batch verifier returning too few results cannot leave callers hanging."""
+    import asyncio
+
+    def verify_batch(items):
+        return [True]
+
+    order = Order(
+        order_id="short",
+        user_address="GUSER",
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("1.5"),
+        quantity=Decimal("100"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+
+    batcher = SignatureBatcher(verify_batch, verify_one=lambda o, s, pk: s == "good", window_ms=50, max_batch=8)
+    try:
+        results = await asyncio.wait_for(asyncio.gather(
+            batcher.verify(order, "good", "GUSER"),
+            batcher.verify(order, "bad", "GUSER"),
+        ), timeout=5)
+    finally:
+        await batcher.aclose()
+    assert results == [True, False]
+
+    batcher = SignatureBatcher(verify_batch, window_ms=50, max_batch=8)
+    try:
+        results = await asyncio.wait_for(asyncio.gather(
+            batcher.verify(order, "good", "GUSER"),
+            batcher.verify(order, "bad", "GUSER"),
+            return_exceptions=True
+        ), timeout=5)
+    finally:
+        await batcher.aclose()
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_signature_batcher_aclose_fails_waiting_callers():
+    """Test that closing the batcher stops its worker and fails callers still waiting."""
+    import asyncio
+    import threading
+
+    release = threading.Event()
+
+    def verify_batch(items):
+        release.wait(5)
+        return [True] * len(items)
+
+    order = Order(
+        order_id="closing",
+        user_address="GUSER",
+        asset_pair=AssetPair(base="XLM", quote="USDC"),
+        side=OrderSide.Buy,
+        order_type=OrderType.Limit,
+        price=Decimal("1.5"),
+        quantity=Decimal("100"),
+        time_in_force=TimeInForce.GTC,
+        timestamp=1234567890
+    )
+
+    batcher = SignatureBatcher(verify_batch, window_ms=1, max_batch=1)
+    in_flight = asyncio.ensure_future(batcher.verify(order, "first", "GUSER"))
+    queued = asyncio.ensure_future(batcher.verify(order, "second", "GUSER"))
+    await asyncio.sleep(0.05)
+    worker = batcher._task
+
+    try:
+        await batcher.aclose()
+    finally:
+        release.set()
+
+    assert worker.done()
+    results = await asyncio.wait_for(asyncio.gather(in_flight, queued, return_exceptions=True), timeout=5)
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -20,26 +20,30 @@ Examples:
 """
 
 import hashlib
+import io
 import json
 import sys
 from typing import Any, Dict
 
+try:
+    import ijson
+except ImportError:  # optional; event logs are parsed with json when absent
+    ijson = None
+
+# Parse errors the attestation readers can raise, whichever parser is active
+EVENT_LOG_ERRORS = (json.JSONDecodeError, KeyError, StopIteration) + ((ijson.JSONError,) if ijson else ())
 
-def sort_object(obj: Any) -> Any:
-    """Recursively sort object keys lexicographically."""
-    if isinstance(obj, dict):
-        return {k: sort_object(v) for k, v in sorted(obj.items())}
-    elif isinstance(obj, list):
-        return [sort_object(item) for item in obj]
-    else:
-        return obj
+
+def to_deterministic_json_bytes(obj: Any) -> bytes:
+    """Deterministic UTF-8 JSON (compact, keys sorted at every level)."""
+    # Stays on the stdlib encoder: orjson formats small floats differently
+    # (1e-7 vs 1e-07), which would change the hash
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, sort_keys=True).encode("utf-8")
 
 
 def to_deterministic_json(obj: Any) -> str:
     """Convert to deterministic JSON (compact, sorted keys)."""
-    sorted_obj = sort_object(obj)
-    # Compact JSON with no extra whitespace
-    return json.dumps(sorted_obj, separators=(",", ":"), ensure_ascii=False)
+    return to_deterministic_json_bytes(obj).decode("utf-8")
 
 
 def get_compose_hash(app_compose: Dict[str, Any]) -> str:
@@ -52,14 +56,31 @@ def get_compose_hash(app_compose: Dict[str, Any]) -> str:
     Returns:
         32-byte hex hash (64 hex characters)
     """
-    # Remove None values
-    cleaned = {k: v for k, v in app_compose.items() if v is not None}
+    # Remove None values; copy only when there is one to drop
+    cleaned = app_compose
+    if None in app_compose.values():
+        cleaned = {k: v for k, v in app_compose.items() if v is not None}
+
+    # SHA256 over the deterministic JSON bytes
+    return hashlib.sha256(to_deterministic_json_bytes(cleaned)).hexdigest()
 
-    # Create deterministic JSON
-    manifest_str = to_deterministic_json(cleaned)
 
-    # SHA256 hash
-    return hashlib.sha256(manifest_str.encode("utf-8")).hexdigest()
+def find_attested_compose_hash(event_log: str) -> str:
+    """
+    Return the payload of the first `compose-hash` event in a JSON event log.
+
+    Streams the log with ijson when installed so parsing stops at the match;
+    raises StopIteration if the event is missing.
+    """
+    if ijson is not None:
+        events = ijson.items(io.BytesIO(event_log.encode("utf-8")), "item")
+    else:
+        events = json.loads(event_log)
+    return next(
+        e['event_payload']
+        for e in events
+        if e.get('event') == 'compose-hash'
+    )
 
 
 def main():
@@ -88,12 +109,7 @@ def main():
             with open(attestation_file, 'r') as f:
                 attestation = json.load(f)
 
-            event_log = json.loads(attestation['event_log'])
-            attested_hash = next(
-                e['event_payload']
-                for e in event_log
-                if e.get('event') == 'compose-hash'
-            )
+            attested_hash = find_attested_compose_hash(attestation['event_log'])
 
             print(f"Attested compose-hash: {attested_hash}")
             print()
@@ -110,7 +126,7 @@ def main():
         except FileNotFoundError:
             print(f"Error: File '{attestation_file}' not found")
             sys.exit(1)
-        except (json.JSONDecodeError, KeyError, StopIteration) as e:
+        except EVENT_LOG_ERRORS as e:
             print(f"Error: Failed to parse attestation file: {e}")
             sys.exit(1)
 
@@ -6,7 +6,8 @@ This ensures signature compatibility with stellar-sdk.
 
 import sys
 import json
-import base64
+import binascii
+import hashlib
 
 try:
     from stellar_sdk import Keypair
@@ -15,6 +16,9 @@ except ImportError:
     print("Install with: pip install stellar-sdk", file=sys.stderr)
     sys.exit(1)
 
+# SEP-0053 prefix absorbed once; each order hashes a copy
+_SEP0053_HASHER = hashlib.sha256(b"Stellar Signed Message:\n")
+
 
 def sign_order(secret_key_strkey: str, order_json: str) -> str:
     """
@@ -28,32 +32,20 @@ def sign_order(secret_key_strkey: str, order_json: str) -> str:
     order = json.loads(order_json)
     
     # Create order message (matching Rust format)
-    parts = []
-    parts.append(f"order_id:{order['order_id']}")
-    parts.append(f"user:{order['user_address']}")
-    parts.append(f"pair:{order['asset_pair']['base']}/{order['asset_pair']['quote']}")
-    parts.append(f"side:{order['side']}")
-    parts.append(f"type:{order['order_type']}")
-    
-    if order.get('price') is not None:
-        parts.append(f"price:{order['price']}")
-    
-    parts.append(f"quantity:{order['quantity']}")
-    parts.append(f"tif:{order['time_in_force']}")
-    parts.append(f"timestamp:{order['timestamp']}")
-    
-    if order.get('expiration') is not None:
-        parts.append(f"expiration:{order['expiration']}")
-    
-    order_message = "|".join(parts)
-    
-    # SEP-0053: Prefix message
-    sep0053_prefix = "Stellar Signed Message:\n"
-    payload = sep0053_prefix.encode() + order_message.encode()
+    pair = order['asset_pair']
+    price = f"|price:{order['price']}" if order.get('price') is not None else ""
+    expiration = f"|expiration:{order['expiration']}" if order.get('expiration') is not None else ""
+    order_message = (
+        f"order_id:{order['order_id']}|user:{order['user_address']}"
+        f"|pair:{pair['base']}/{pair['quote']}|side:{order['side']}|type:{order['order_type']}"
+        f"{price}|quantity:{order['quantity']}|tif:{order['time_in_force']}"
+        f"|timestamp:{order['timestamp']}{expiration}"
+    )
     
-    # Hash payload (SHA-256)
-    import hashlib
-    digest = hashlib.sha256(payload).digest()
+    # SEP-0053: hash prefix || message (SHA-256), fed incrementally
+    hasher = _SEP0053_HASHER.copy()
+    hasher.update(order_message.encode())
+    digest = hasher.digest()
     
     # Create keypair from secret
     keypair = Keypair.from_secret(secret_key_strkey)
@@ -62,7 +54,7 @@ def sign_order(secret_key_strkey: str, order_json: str) -> str:
     signature_bytes = keypair.sign(digest)
     
     # Return base64-encoded signature
-    return base64.b64encode(signature_bytes).decode('ascii')
+    return binascii.b2a_base64(signature_bytes, newline=False).decode('ascii')
 
 
 def main():
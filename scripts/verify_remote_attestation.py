@@ -12,6 +12,10 @@ Examples:
     python verify_remote_attestation.py https://stellardark.io
     python verify_remote_attestation.py https://c5d5291eef49362e-443s.dstack-pha-prod9.phala.network
 
+HTTPS requests honour the https_proxy / no_proxy environment variables
+(CONNECT tunnel). Redirects are not followed: the TLS certificate that is
+checked must belong to the host named in base_url.
+
 The script will:
 1. Fetch app-compose JSON from {base_url}/info
 2. Fetch attestation quote from {base_url}/attestation (with optional challenge)
@@ -26,33 +30,41 @@ Exit codes:
     1 - Verification failed or error occurred
 """
 
+import base64
 import hashlib
+import hmac
+import http.client
 import json
 import sys
-import urllib.request
-import urllib.error
 import ssl
 import socket
+import urllib.request
 import argparse
 import secrets
-from typing import Any, Dict, Optional
-from urllib.parse import urlparse, urlencode
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import unquote, urlparse, urlencode
 
+try:
+    import orjson
+except ImportError:  # optional; attestation payloads are parsed with json when absent
+    orjson = None
 
-def sort_object(obj: Any) -> Any:
-    """Recursively sort object keys lexicographically."""
-    if isinstance(obj, dict):
-        return {k: sort_object(v) for k, v in sorted(obj.items())}
-    elif isinstance(obj, list):
-        return [sort_object(item) for item in obj]
-    else:
-        return obj
+# Parser for the attestation payload and its event log, the largest documents
+# the script reads. app-compose stays on json.loads: it is hashed, and orjson
+# turns integers wider than 64 bits into floats.
+_fast_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def to_deterministic_json_bytes(obj: Any) -> bytes:
+    """Deterministic UTF-8 JSON (compact, keys sorted at every level)."""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, sort_keys=True).encode("utf-8")
 
 
 def to_deterministic_json(obj: Any) -> str:
     """Convert to deterministic JSON (compact, sorted keys)."""
-    sorted_obj = sort_object(obj)
-    return json.dumps(sorted_obj, separators=(",", ":"), ensure_ascii=False)
+    return to_deterministic_json_bytes(obj).decode("utf-8")
 
 
 def get_compose_hash(app_compose: Dict[str, Any]) -> str:
@@ -65,49 +77,166 @@ def get_compose_hash(app_compose: Dict[str, Any]) -> str:
     Returns:
         32-byte hex hash (64 hex characters)
     """
-    # Remove None values
-    cleaned = {k: v for k, v in app_compose.items() if v is not None}
+    # Remove None values; copy only when there is one to drop
+    cleaned = app_compose
+    if None in app_compose.values():
+        cleaned = {k: v for k, v in app_compose.items() if v is not None}
+
+    # SHA256 over the deterministic JSON bytes
+    return hashlib.sha256(to_deterministic_json_bytes(cleaned)).hexdigest()
+
+
+@lru_cache(maxsize=32)
+def get_compose_hash_from_json(app_compose_json: str) -> str:
+    """
+    Compute the compose-hash of an app-compose JSON document.
+
+    Memoized on the document text, so re-verifying an unchanged /info
+    response skips parsing and canonicalization.
+    """
+    return get_compose_hash(json.loads(app_compose_json))
 
-    # Create deterministic JSON
-    manifest_str = to_deterministic_json(cleaned)
 
-    # SHA256 hash
-    return hashlib.sha256(manifest_str.encode("utf-8")).hexdigest()
+USER_AGENT = 'Mozilla/5.0 (compatible; PhalaVerifier/1.0)'
 
+# SSL context that allows self-signed certificates and older TLS versions.
+# Built once and shared by the API fetches and the SPKI probe; it holds no
+# per-connection state.
+_PERMISSIVE_CTX = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+_PERMISSIVE_CTX.check_hostname = False
+_PERMISSIVE_CTX.verify_mode = ssl.CERT_NONE
+# Allow all TLS versions and ciphers to match curl's behavior
+_PERMISSIVE_CTX.minimum_version = ssl.TLSVersion.TLSv1_2
+_PERMISSIVE_CTX.options &= ~ssl.OP_NO_SSLv3  # Be more permissive
 
-def fetch_json(url: str, allow_self_signed: bool = True) -> Dict[str, Any]:
+
+@lru_cache(maxsize=32)
+def _host_port(base_url: str) -> Tuple[str, int]:
+    """Hostname and port of a base URL, parsed once per URL."""
+    parsed = urlparse(base_url)
+    default_port = 80 if parsed.scheme == 'http' else 443
+    return parsed.hostname or parsed.netloc.split(':')[0], parsed.port or default_port
+
+
+def _https_proxy(hostname: str) -> Optional[Tuple[str, int, Dict[str, str]]]:
     """
-    Fetch JSON from a URL.
+    Proxy to tunnel HTTPS requests to hostname through, from the environment.
+
+    Returns:
+        (proxy host, proxy port, CONNECT headers), or None to connect directly
+    """
+    proxy_url = urllib.request.getproxies().get('https')
+    if not proxy_url or urllib.request.proxy_bypass(hostname):
+        return None
+    parsed = urlparse(proxy_url if '://' in proxy_url else f"http://{proxy_url}")
+    headers = {}
+    if parsed.username:
+        credentials = f"{unquote(parsed.username)}:{unquote(parsed.password or '')}"
+        headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode()).decode('ascii')
+    return parsed.hostname, parsed.port or 80, headers
+
+
+def open_connection(base_url: str, allow_self_signed: bool = True) -> http.client.HTTPConnection:
+    """
+    Open a connection to the server behind base_url.
+
+    HTTPS goes through the https_proxy from the environment when one applies.
+    Plain-HTTP targets are always reached directly.
 
     Args:
-        url: URL to fetch
+        base_url: Base URL of the server
         allow_self_signed: Allow self-signed certificates (default: True)
 
+    Returns:
+        An HTTP(S) connection; it connects lazily on the first request
+    """
+    hostname, port = _host_port(base_url)
+    if base_url.startswith('http://'):
+        return http.client.HTTPConnection(hostname, port, timeout=30)
+
+    ctx = _PERMISSIVE_CTX if allow_self_signed else ssl.create_default_context()
+    proxy = _https_proxy(hostname)
+    if proxy is None:
+        return http.client.HTTPSConnection(hostname, port, context=ctx, timeout=30)
+
+    # TLS runs end to end through the tunnel, so the peer certificate is still the server's
+    proxy_host, proxy_port, proxy_headers = proxy
+    conn = http.client.HTTPSConnection(proxy_host, proxy_port, context=ctx, timeout=30)
+    conn.set_tunnel(hostname, port, headers=proxy_headers)
+    return conn
+
+
+def fetch_json(conn: http.client.HTTPConnection, path: str, loads: Callable[[bytes], Any] = json.loads) -> Dict[str, Any]:
+    """
+    Fetch JSON over an open connection.
+
+    Args:
+        conn: Connection from open_connection()
+        path: Request path (including any query string)
+        loads: JSON parser applied to the response body
+
     Returns:
         Parsed JSON as dictionary
 
     Raises:
-        urllib.error.URLError: If request fails
+        OSError: If the connection fails
+        http.client.HTTPException: If the server returns an error status
         json.JSONDecodeError: If response is not valid JSON
     """
-    # Create SSL context that allows self-signed certificates and older TLS versions
-    if allow_self_signed:
-        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        # Allow all TLS versions and ciphers to match curl's behavior
-        ctx.minimum_version = ssl.TLSVersion.TLSv1_2
-        ctx.options &= ~ssl.OP_NO_SSLv3  # Be more permissive
-    else:
-        ctx = ssl.create_default_context()
+    conn.request('GET', path, headers={'User-Agent': USER_AGENT})
+    response = conn.getresponse()
+
+    # Redirects are not followed (see the module docstring); a 3xx is an error
+    data = response.read()
+    if response.status != 200:
+        raise http.client.HTTPException(f"HTTP Error {response.status}: {response.reason}")
+    return loads(data)
+
+
+def _find_app_compose(info_data: Dict[str, Any]) -> Any:
+    """Return the raw app_compose value (JSON text or dict) from an /info response, or None."""
+    # Try different possible locations for app_compose in the response
+    # Some APIs return it directly, others nest it under tcb_info
+    if 'app_compose' in info_data:
+        return info_data['app_compose']
+    if 'tcb_info' in info_data and 'app_compose' in info_data['tcb_info']:
+        return info_data['tcb_info']['app_compose']
+    return None
+
 
-    # Create request with timeout
-    req = urllib.request.Request(url)
-    req.add_header('User-Agent', 'Mozilla/5.0 (compatible; PhalaVerifier/1.0)')
+def fetch_json_once(base_url: str, path: str, loads: Callable[[bytes], Any] = json.loads) -> Dict[str, Any]:
+    """
+    Fetch JSON from base_url + path on a connection of its own.
 
-    with urllib.request.urlopen(req, context=ctx, timeout=30) as response:
-        data = response.read()
-        return json.loads(data)
+    Safe to run from worker threads; raises the same errors as fetch_json.
+    """
+    conn = open_connection(base_url)
+    try:
+        return fetch_json(conn, path, loads)
+    finally:
+        conn.close()
+
+
+def fetch_json_with_peer_cert(
+    base_url: str, path: str, loads: Callable[[bytes], Any] = json.loads
+) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    """
+    Fetch JSON like fetch_json_once and capture the server certificate.
+
+    The certificate is read from the TLS socket that serves the request,
+    so checking it needs no extra handshake.
+
+    Returns:
+        (parsed JSON, DER certificate or None for plain HTTP)
+    """
+    conn = open_connection(base_url)
+    try:
+        conn.connect()
+        sock = conn.sock
+        cert_der = sock.getpeercert(binary_form=True) if isinstance(sock, ssl.SSLSocket) else None
+        return fetch_json(conn, path, loads), cert_der
+    finally:
+        conn.close()
 
 
 def extract_app_compose_from_info(info_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -120,14 +249,7 @@ def extract_app_compose_from_info(info_data: Dict[str, Any]) -> Optional[Dict[st
     Returns:
         App-compose dictionary or None if not found
     """
-    # Try different possible locations for app_compose in the response
-    # Some APIs return it directly, others nest it under tcb_info
-    if 'app_compose' in info_data:
-        app_compose = info_data['app_compose']
-    elif 'tcb_info' in info_data and 'app_compose' in info_data['tcb_info']:
-        app_compose = info_data['tcb_info']['app_compose']
-    else:
-        return None
+    app_compose = _find_app_compose(info_data)
 
     # If it's a string, parse it as JSON
     if isinstance(app_compose, str):
@@ -136,38 +258,97 @@ def extract_app_compose_from_info(info_data: Dict[str, Any]) -> Optional[Dict[st
     return app_compose
 
 
-def extract_compose_hash_from_attestation(attestation_data: Dict[str, Any]) -> Optional[str]:
+def index_event_log(attestation_data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Extract compose-hash from attestation event log.
+    Index the attestation event log by event name.
 
     Args:
         attestation_data: Response from /attestation endpoint
 
     Returns:
-        Compose-hash string or None if not found
+        Mapping of event name to the payload of its first occurrence
+        (empty if there is no event log)
     """
     event_log_str = attestation_data.get('event_log')
     if not event_log_str:
-        return None
+        return {}
 
     # Parse event log if it's a string
     if isinstance(event_log_str, str):
-        event_log = json.loads(event_log_str)
+        event_log = _fast_json_loads(event_log_str)
     else:
         event_log = event_log_str
 
-    # Find compose-hash event
+    index: Dict[str, Any] = {}
     for event in event_log:
-        if event.get('event') == 'compose-hash':
-            return event.get('event_payload')
+        index.setdefault(event.get('event'), event.get('event_payload'))
+    return index
 
-    return None
+
+def extract_compose_hash_from_attestation(attestation_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Extract compose-hash from attestation event log.
+
+    Args:
+        attestation_data: Response from /attestation endpoint
+
+    Returns:
+        Compose-hash string or None if not found
+    """
+    return index_event_log(attestation_data).get('compose-hash')
+
+
+@lru_cache(maxsize=64)
+def _spki_hash_of_der(cert_der: bytes) -> str:
+    """SHA256 of a DER certificate's SPKI; memoized so a known certificate skips the ASN.1 parse."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import serialization
+
+    # Get SPKI (Subject Public Key Info) in DER format
+    spki_der = x509.load_der_x509_certificate(cert_der).public_key().public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(spki_der).hexdigest()
+
+
+def get_spki_hash_from_der(cert_der: bytes, cert_output_path: Optional[str] = None) -> Optional[str]:
+    """
+    Compute the SPKI hash of a DER-encoded certificate.
+
+    Args:
+        cert_der: Certificate in DER format
+        cert_output_path: Optional path to save certificate in PEM format
+
+    Returns:
+        SPKI hash (hex string) or None if parsing fails
+    """
+    try:
+        # Requires the cryptography library
+        spki_hash = _spki_hash_of_der(cert_der)
+
+        # Save certificate if requested
+        if cert_output_path:
+            with open(cert_output_path, 'w') as f:
+                f.write(ssl.DER_cert_to_PEM_cert(cert_der))
+
+        return spki_hash
+
+    except ImportError:
+        # Fallback: cryptography library not available
+        return None
+    except Exception:
+        # Any parsing or file error
+        return None
 
 
 def get_tls_spki_hash(base_url: str, cert_output_path: Optional[str] = None) -> Optional[str]:
     """
     Extract TLS certificate from server and compute SPKI hash.
 
+    Opens a dedicated TLS connection; used when no certificate was captured
+    from the API connection.
+
     Args:
         base_url: Base URL of the server
         cert_output_path: Optional path to save certificate in PEM format
@@ -176,50 +357,43 @@ def get_tls_spki_hash(base_url: str, cert_output_path: Optional[str] = None) ->
         SPKI hash (hex string) or None if extraction fails
     """
     try:
-        # Try to use cryptography library for SPKI extraction
-        from cryptography import x509
-        from cryptography.hazmat.primitives import serialization
-
-        # Parse URL to get hostname and port
-        parsed = urlparse(base_url)
-        hostname = parsed.hostname or parsed.netloc.split(':')[0]
-        port = parsed.port or 443
-
-        # Create SSL context that doesn't verify certificates
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
+        hostname, port = _host_port(base_url)
 
-        # Connect and get certificate
+        # Connect and get certificate (the certificate is not verified)
         with socket.create_connection((hostname, port), timeout=10) as sock:
-            with context.wrap_socket(sock, server_hostname=hostname) as ssock:
+            with _PERMISSIVE_CTX.wrap_socket(sock, server_hostname=hostname) as ssock:
                 cert_der = ssock.getpeercert(binary_form=True)
+    except Exception:
+        # Any connection error
+        return None
 
-                # Load certificate
-                cert = x509.load_der_x509_certificate(cert_der)
+    return get_spki_hash_from_der(cert_der, cert_output_path)
 
-                # Save certificate if requested
-                if cert_output_path:
-                    cert_pem = cert.public_bytes(encoding=serialization.Encoding.PEM)
-                    with open(cert_output_path, 'wb') as f:
-                        f.write(cert_pem)
 
-                # Get SPKI (Subject Public Key Info) in DER format
-                spki_der = cert.public_key().public_bytes(
-                    encoding=serialization.Encoding.DER,
-                    format=serialization.PublicFormat.SubjectPublicKeyInfo
-                )
+def hashes_match(expected: str, actual: Any) -> bool:
+    """
+    Compare two hex digests in constant time.
 
-                # Hash it with SHA256
-                spki_hash = hashlib.sha256(spki_der).hexdigest()
-                return spki_hash
+    Returns False rather than raising when the attested value is not an
+    ASCII string.
+    """
+    try:
+        return hmac.compare_digest(expected, actual)
+    except TypeError:
+        return False
 
-    except ImportError:
-        # Fallback: cryptography library not available
-        return None
-    except Exception:
-        # Any connection or parsing error
-        return None
+
+def report_data_hash(stellar_pubkey: str, tls_spki_hash: str, timestamp: Any, challenge: str) -> bytes:
+    """
+    Compute the expected report_data hash for an attested identity.
+
+    The preimage is stellar_pubkey|tls_spki_hash|timestamp|challenge.
+
+    Returns:
+        SHA256 of the preimage (32 bytes)
+    """
+    preimage = f"{stellar_pubkey}|{tls_spki_hash}|{timestamp}|{challenge}"
+    return hashlib.sha256(preimage.encode()).digest()
 
 
 def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_path: Optional[str] = None, use_challenge: bool = False) -> bool:
@@ -237,6 +411,7 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
     """
     # Normalize base URL (remove trailing slash)
     base_url = base_url.rstrip('/')
+    base_path = urlparse(base_url).path
 
     # Generate challenge if requested
     challenge_hex = None
@@ -253,16 +428,27 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
         print("=" * 70)
         print()
 
+    # /info and /attestation are independent network round trips; start them
+    # together and consume the results step by step. The TLS certificate is
+    # taken from the /attestation connection.
+    attestation_query = f"?challenge={challenge_hex}" if challenge_hex else ""
+    executor = ThreadPoolExecutor(max_workers=2)
+    info_future = executor.submit(fetch_json_once, base_url, f"{base_path}/info")
+    attestation_future = executor.submit(
+        fetch_json_with_peer_cert, base_url, f"{base_path}/attestation{attestation_query}", _fast_json_loads
+    )
+    executor.shutdown(wait=False)
+
     # Step 1: Fetch app-compose from /info
     info_url = f"{base_url}/info"
     if verbose:
         print(f"[1/5] Fetching app-compose from {info_url}")
 
     try:
-        info_data = fetch_json(info_url)
+        info_data = info_future.result()
         if verbose:
             print("      ✓ Successfully fetched /info")
-    except urllib.error.URLError as e:
+    except (OSError, http.client.HTTPException) as e:
         print(f"      ✗ Error fetching /info: {e}")
         return False
     except json.JSONDecodeError as e:
@@ -284,7 +470,11 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
         print("[2/5] Computing compose-hash from app-compose")
 
     try:
-        computed_hash = get_compose_hash(app_compose)
+        raw_app_compose = _find_app_compose(info_data)
+        if isinstance(raw_app_compose, str):
+            computed_hash = get_compose_hash_from_json(raw_app_compose)
+        else:
+            computed_hash = get_compose_hash(app_compose)
         if verbose:
             print(f"      ✓ Computed: {computed_hash}")
             print()
@@ -293,18 +483,16 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
         return False
 
     # Step 3: Fetch attestation from /attestation
-    attestation_url = f"{base_url}/attestation"
-    if challenge_hex:
-        attestation_url = f"{attestation_url}?challenge={challenge_hex}"
+    attestation_url = f"{base_url}/attestation{attestation_query}"
 
     if verbose:
         print(f"[3/5] Fetching attestation from {attestation_url}")
 
     try:
-        attestation_data = fetch_json(attestation_url)
+        attestation_data, peer_cert_der = attestation_future.result()
         if verbose:
             print("      ✓ Successfully fetched /attestation")
-    except urllib.error.URLError as e:
+    except (OSError, http.client.HTTPException) as e:
         print(f"      ✗ Error fetching /attestation: {e}")
         return False
     except json.JSONDecodeError as e:
@@ -325,7 +513,7 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
     if verbose:
         print("[4/5] Verifying compose-hash match")
 
-    if computed_hash != attested_hash:
+    if not hashes_match(computed_hash, attested_hash):
         if verbose:
             print("      ✗ Hashes DO NOT match!")
             print()
@@ -358,7 +546,10 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
             print()
     else:
         # Get TLS certificate from live connection
-        live_tls_spki = get_tls_spki_hash(base_url, cert_output_path)
+        if peer_cert_der:
+            live_tls_spki = get_spki_hash_from_der(peer_cert_der, cert_output_path)
+        else:
+            live_tls_spki = get_tls_spki_hash(base_url, cert_output_path)
 
         if not live_tls_spki:
             if verbose:
@@ -371,7 +562,7 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
                 print(f"      Attested:  {attested_tls_spki}")
                 print(f"      Live cert: {live_tls_spki}")
 
-            if live_tls_spki == attested_tls_spki:
+            if hashes_match(live_tls_spki, attested_tls_spki):
                 if verbose:
                     print("      ✓ TLS SPKI hashes match!")
                     print()
@@ -408,7 +599,7 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
     else:
         # If we sent a challenge, verify it matches
         if challenge_hex:
-            if response_challenge != challenge_hex:
+            if not hashes_match(response_challenge, challenge_hex):
                 if verbose:
                     print(f"      ✗ Challenge mismatch!")
                     print(f"        Sent:     {challenge_hex}")
@@ -423,12 +614,8 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
             if verbose:
                 print(f"      ✓ Challenge matches: {challenge_hex}")
 
-        # Reconstruct preimage: stellar_pubkey|tls_spki_hash|timestamp|challenge
-        preimage = f"{stellar_pubkey}|{tls_spki_hash}|{timestamp}|{response_challenge}"
-        
-        # Compute hash (32 bytes)
-        computed_hash_bytes = hashlib.sha256(preimage.encode()).digest()
-        computed_hash_hex = computed_hash_bytes.hex()
+        # Hash of the reconstructed preimage (32 bytes)
+        computed_hash_bytes = report_data_hash(stellar_pubkey, tls_spki_hash, timestamp, response_challenge)
         
         # Use identity.report_data_hash as primary source (it's the 32-byte hash we computed)
         attested_hash = identity.get('report_data_hash')
@@ -457,14 +644,20 @@ def verify_remote_attestation(base_url: str, verbose: bool = True, cert_output_p
                 print()
         else:
             if verbose:
-                print(f"      Preimage:  {preimage}")
-                print(f"      Computed:  {computed_hash_hex}")
+                print(f"      Preimage:  {stellar_pubkey}|{tls_spki_hash}|{timestamp}|{response_challenge}")
+                print(f"      Computed:  {computed_hash_bytes.hex()}")
                 print(f"      Identity hash: {identity.get('report_data_hash', 'N/A')}")
                 if quote_report_data_32:
                     print(f"      Quote report_data (first 32B): {quote_report_data_32}")
                 print(f"      Using attested:  {attested_hash}")
             
-            if computed_hash_hex == attested_hash:
+            # Compare raw digests; a value that is not valid hex never matches
+            try:
+                attested_hash_bytes = bytes.fromhex(attested_hash)
+            except (TypeError, ValueError):
+                attested_hash_bytes = b""
+
+            if hmac.compare_digest(computed_hash_bytes, attested_hash_bytes):
                 report_data_verified = True
                 if verbose:
                     print("      ✓ Report data hash matches!")